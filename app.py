@@ -1,12 +1,30 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, send_from_directory, abort
+from markupsafe import Markup
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.utils import secure_filename
+from sqlalchemy import or_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import selectinload
+from werkzeug.utils import secure_filename, safe_join
 from werkzeug.security import check_password_hash, generate_password_hash
 import os
+import json
+import mimetypes
+from urllib.parse import quote, urlsplit
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 from functools import wraps
+from menu_cache import menu_cache, content_etag
 from PIL import Image
+from image_pipeline import (IMAGE_SIZES, generate_variants, default_variant, variants_of_format, build_srcset,
+                            build_sources, file_sha256, content_base_name, is_content_addressed, is_valid_image)
+from image_jobs import image_job_queue
+from compression import MIN_COMPRESS_SIZE, negotiate_encoding, precompressed_path, precompress_static
+from static_assets import static_assets, is_fingerprinted
+from metrics import request_metrics
+from database import init_database, is_sqlite
+from search_index import (MAX_QUERY_LENGTH, MAX_QUERY_TERMS, SEARCH_FIELDS, create_search_index, search_dish_ids,
+                          search_index_exists, index_dishes, remove_dishes)
 
 # 尝试导入CDN服务，如果失败则使用本地存储
 try:
@@ -21,15 +39,37 @@ except ImportError:
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///menu.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///menu.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'static/images'
+# 等待后台处理的原始上传图片
+app.config['IMAGE_SPOOL_FOLDER'] = os.path.join(app.instance_path, 'image_spool')
+# 生产环境由Nginx发送静态文件（X-Accel-Redirect），未配置时由Flask通过sendfile发送
+app.config['STATIC_ACCEL_REDIRECT'] = Config.STATIC_ACCEL_REDIRECT if Config else None
+
+# 带内容指纹的文件内容永不改变，浏览器和CDN可以缓存一年
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
 
 # 确保上传文件夹存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['IMAGE_SPOOL_FOLDER'], exist_ok=True)
+
+# 启动时为CSS/JS生成带内容指纹的文件名，url_for('static', ...) 自动使用新文件名
+static_assets.init_app(app)
 
+# 启动时预压缩CSS/JS等静态文件（已是最新的会跳过）
+try:
+    precompress_static(app.static_folder)
+except OSError as e:
+    print(f"⚠️  静态文件预压缩失败: {e}")
+
+# SQLite使用WAL等连接设置，并为多线程工作进程配置连接池
+init_database(app)
 db = SQLAlchemy(app)
 
+# 请求耗时、SQL查询次数、响应大小等性能指标（/metrics 和 Server-Timing 头）
+request_metrics.init_app(app)
+
 
 # 身份验证装饰器
 def login_required(f):
@@ -40,77 +80,253 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# 提交菜单相关的修改，并使菜单快照缓存失效
+def commit_menu_changes():
+    # 版本号与修改在同一个事务中提交，其他工作进程看到新版本号时一定也能读到新数据
+    pending_menu_version()
+    db.session.commit()
+    menu_cache.invalidate()
+
+# 递增数据库中的菜单版本号
+def bump_menu_version():
+    """
+    :return: 新的版本号
+    """
+    now = datetime.utcnow()
+    updated = db.session.execute(
+        db.update(MenuVersion)
+        .where(MenuVersion.id == 1)
+        .values(version=MenuVersion.version + 1, changed_at=now)
+    ).rowcount
+    if not updated:
+        db.session.add(MenuVersion(id=1, version=1, changed_at=now))
+        return 1
+    return db.session.execute(db.select(MenuVersion.version).where(MenuVersion.id == 1)).scalar_one()
+
+# 当前事务修改的菜单数据对应的版本号：每个事务第一次修改菜单数据时递增一次
+def pending_menu_version():
+    version = db.session.info.get('menu_version')
+    if version is None:
+        # 递增时不能自动flush，否则 before_flush 会在版本号写入之前再递增一次
+        with db.session.no_autoflush:
+            version = bump_menu_version()
+        db.session.info['menu_version'] = version
+    return version
+
+# 读取数据库中的菜单版本号，供菜单缓存判断快照是否过期
+def read_menu_version():
+    row = db.session.execute(
+        db.select(MenuVersion.version, MenuVersion.changed_at).where(MenuVersion.id == 1)
+    ).first()
+    if row is None:
+        return 0, None
+    return row.version, row.changed_at.replace(tzinfo=timezone.utc)
+
 # 自动生成菜品序号
 def generate_dish_number(category_id):
-    """根据分类ID生成菜品序号，格式如 A1, B2, C3"""
-    category = Category.query.get(category_id)
-    if not category:
+    """
+    根据分类ID生成菜品序号，格式如 A1, B2, C3
+    在当前事务中原子递增分类的序号计数器：UPDATE 会拿到SQLite写锁，
+    并发的请求会排队等待，同一个号码不会分配两次
+    """
+    allocated = db.session.execute(
+        db.update(Category)
+        .where(Category.id == category_id)
+        .values(next_dish_number=Category.next_dish_number + 1)
+    ).rowcount
+    if not allocated:
         return None
     
-    # 获取该分类下现有的最大序号
-    existing_dishes = Dish.query.filter_by(category_id=category_id).all()
-    max_number = 0
-    
-    for dish in existing_dishes:
-        # 提取序号中的数字部分
-        if dish.dish_number and dish.dish_number.startswith(category.prefix_letter):
-            try:
-                number = int(dish.dish_number[1:])
-                max_number = max(max_number, number)
-            except ValueError:
-                continue
-    
-    # 返回新的序号
-    return f"{category.prefix_letter}{max_number + 1}"
+    prefix_letter, next_number = db.session.execute(
+        db.select(Category.prefix_letter, Category.next_dish_number).where(Category.id == category_id)
+    ).one()
+    return f"{prefix_letter}{next_number - 1}"
 
 # 重新排序分类下的所有菜品序号
 def reorder_dishes_in_category(category_id):
-    """重新排序指定分类下的所有菜品序号"""
-    dishes = Dish.query.filter_by(category_id=category_id).order_by(Dish.sort_order, Dish.id).all()
-    category = Category.query.get(category_id)
+    """
+    按排序号把指定分类下的菜品序号重新编为 1..n（在调用方的事务中执行，由调用方提交）
+    dish_number 有唯一约束，SQLite逐行检查，直接改写可能与尚未改写的旧序号冲突，
+    所以先把序号改为临时值（'#' + id），再按窗口函数算出的位置一次性写入最终序号
+    位置先写入临时表再按主键读取：UPDATE ... FROM 需要SQLite 3.33，Ubuntu 20.04 自带的是3.31
+    """
+    # 先把会话中未提交的修改（如菜品换了分类、删除菜品）写入数据库
+    db.session.flush()
+    params = {'category_id': category_id, 'version': pending_menu_version()}
+    db.session.execute(db.text(
+        "CREATE TEMP TABLE IF NOT EXISTS dish_position (id INTEGER PRIMARY KEY, position INTEGER NOT NULL)"
+    ))
+    db.session.execute(db.text("DELETE FROM dish_position"))
+    db.session.execute(db.text("""
+        INSERT INTO dish_position (id, position)
+        SELECT id, ROW_NUMBER() OVER (ORDER BY sort_order, id)
+        FROM dish WHERE category_id = :category_id
+    """), params)
+    db.session.execute(db.text(
+        "UPDATE dish SET dish_number = '#' || id WHERE category_id = :category_id"
+    ), params)
+    db.session.execute(db.text("""
+        UPDATE dish
+        SET dish_number = (SELECT prefix_letter FROM category WHERE id = :category_id)
+                          || (SELECT position FROM dish_position WHERE dish_position.id = dish.id),
+            version = :version
+        WHERE category_id = :category_id
+    """), params)
+    # 序号重新从1排列后，计数器接着最后一个序号
+    db.session.execute(db.text("""
+        UPDATE category
+        SET next_dish_number = 1 + (SELECT COUNT(*) FROM dish WHERE category_id = :category_id)
+        WHERE id = :category_id
+    """), params)
+    # 会话中已加载的菜品和分类对象下次访问时重新读取
+    db.session.expire_all()
+
+# 保存原始上传图片，等待后台任务处理
+def spool_uploaded_image(file):
+    """
+    :param file: 上传的文件对象
+    :return: 暂存目录中的文件名，不是有效图片时返回None（不保留文件）
+    """
+    filename = secure_filename(file.filename)
+    # 生成唯一文件名
+    unique_filename = f"{uuid.uuid4()}_{filename}"
+    spool_path = os.path.join(app.config['IMAGE_SPOOL_FOLDER'], unique_filename)
+    file.save(spool_path)
+    # 无法识别的文件在上传时就拒绝，不交给后台任务反复重试
+    if not is_valid_image(spool_path):
+        os.remove(spool_path)
+        return None
+    return unique_filename
+
+# 处理菜品图片：按内容哈希命名并生成多分辨率版本，CDN可用时一并上传
+def process_dish_image(source_path):
+    """
+    处理原始图片（耗时操作，由后台任务执行）
+    相同内容的图片已被其他菜品使用时，直接复用已有的版本，不重新编码和上传
+    :param source_path: 原始图片路径
+    :return: (本地图片路径, CDN图片URL, 多分辨率版本JSON, 内容哈希)
+    """
+    image_hash = file_sha256(source_path)
+    existing = Dish.query.filter(Dish.image_hash == image_hash, Dish.image_variants.isnot(None)).first()
+    if existing:
+        return existing.image, existing.image_cdn_url, existing.image_variants, image_hash
     
-    if not category:
+    upload_folder = app.config['UPLOAD_FOLDER']
+    variants = generate_variants(source_path, upload_folder, content_base_name(image_hash))
+    
+    records = [{'width': v['width'], 'format': v['format'], 'path': f"images/{v['filename']}", 'cdn_url': None}
+               for v in variants]
+    
+    # 尝试上传到CDN（文件名由内容决定，可以永久缓存）
+    if CDN_AVAILABLE and cdn_service and cdn_service.is_enabled():
+        for record, variant in zip(records, variants):
+            record['cdn_url'] = cdn_service.upload_image(os.path.join(upload_folder, variant['filename']),
+                                                         variant['filename'],
+                                                         cache_control=IMMUTABLE_CACHE_CONTROL)
+        if all(record['cdn_url'] for record in records):
+            # 如果CDN上传成功且不需要本地备份，删除本地文件
+            if not Config.LOCAL_BACKUP:
+                for record, variant in zip(records, variants):
+                    os.remove(os.path.join(upload_folder, variant['filename']))
+                    record['path'] = None
+        else:
+            # CDN上传失败，使用本地文件
+            for record in records:
+                record['cdn_url'] = None
+    
+    default = default_variant(records)
+    return default['path'], default['cdn_url'], json.dumps(records), image_hash
+
+# 图片任务已被取消（菜品已删除），重试也不会成功
+class ImageJobCancelled(Exception):
+    pass
+
+# 后台图片任务：处理完成后才替换菜品图片，处理期间菜单继续显示旧图片
+def process_image_job(job):
+    source_path = os.path.join(app.config['IMAGE_SPOOL_FOLDER'], job.filename)
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(f"原始图片不存在: {job.filename}")
+    dish = db.session.get(Dish, job.dish_id)
+    newer_job = ImageJob.query.filter(ImageJob.dish_id == job.dish_id, ImageJob.id > job.id).first()
+    
+    if dish is None or newer_job is not None:
+        # 菜品已删除，或之后又上传了新图片，本次上传作废
+        if os.path.exists(source_path):
+            os.remove(source_path)
         return
     
-    for i, dish in enumerate(dishes, 1):
-        dish.dish_number = f"{category.prefix_letter}{i}"
+    started = time.perf_counter()
+    image, image_cdn_url, image_variants, image_hash = process_dish_image(source_path)
+    request_metrics.observe('menu_image_processing_seconds', time.perf_counter() - started)
     
-    db.session.commit()
+    # 写入前确认任务没有被取消：处理期间菜品可能已被删除，SQLite还可能把它的ID分配给新菜品
+    # 条件UPDATE同时拿到写锁，检查之后到提交之前菜品不会再被删除
+    still_processing = ImageJob.query.filter(ImageJob.id == job.id, ImageJob.status == 'processing').update(
+        {'updated_at': datetime.utcnow()}, synchronize_session=False)
+    if not still_processing:
+        raise ImageJobCancelled(f"菜品已删除，图片任务 {job.id} 已取消")
+    db.session.refresh(dish)
+    
+    # 删除旧图片（重新上传同一张图片时保留）
+    if dish.image_hash != image_hash:
+        remove_dish_image_files(dish)
+    dish.image = image
+    dish.image_cdn_url = image_cdn_url
+    dish.image_variants = image_variants
+    dish.image_hash = image_hash
+    commit_menu_changes()
+    
+    os.remove(source_path)
 
-# 图片优化函数
-def optimize_uploaded_image(file_path, max_width=350, quality=75):
-    """
-    优化上传的图片
-    :param file_path: 图片文件路径
-    :param max_width: 最大宽度
-    :param quality: JPEG质量
-    """
+# 删除暂存的原始图片
+def remove_spooled_image(filename):
+    source_path = os.path.join(app.config['IMAGE_SPOOL_FOLDER'], filename)
+    if os.path.exists(source_path):
+        os.remove(source_path)
+
+# 图片任务最终失败：删除暂存的原始图片
+def discard_image_job(job):
+    remove_spooled_image(job.filename)
+
+# 读取菜品的多分辨率图片版本
+def load_image_variants(dish):
+    if not dish.image_variants:
+        return []
     try:
-        with Image.open(file_path) as img:
-            # 转换为RGB模式
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # 调整尺寸
-            if img.width > max_width:
-                ratio = max_width / img.width
-                new_height = int(img.height * ratio)
-                img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-            
-            # 保存优化后的图片
-            img.save(file_path, 'JPEG', quality=quality, optimize=True)
-            return True
-            
-    except Exception as e:
-        print(f"图片优化失败: {e}")
-        return False
+        return json.loads(dish.image_variants)
+    except ValueError:
+        return []
+
+# 统计仍在使用同一图片的其他菜品数量（引用计数）
+# local_only：只统计仍使用本地文件的菜品（已迁移到CDN且删除了本地路径的菜品不再需要这些文件）
+def count_image_references(dish, local_only=False):
+    conditions = []
+    if dish.image_hash:
+        conditions.append(Dish.image_hash == dish.image_hash)
+    if dish.image:
+        conditions.append(Dish.image == dish.image)
+    if dish.image_cdn_url:
+        conditions.append(Dish.image_cdn_url == dish.image_cdn_url)
+    if not conditions:
+        return 0
+    query = Dish.query.filter(Dish.id != dish.id, or_(*conditions))
+    if local_only:
+        query = query.filter(Dish.image.isnot(None))
+    return query.count()
 
+# 删除菜品的本地图片文件（包括所有分辨率版本），其他菜品仍在使用时保留，返回删除的文件
+def remove_dish_image_files(dish, local_only=False):
+    if count_image_references(dish, local_only) > 0:
+        return []
+    removed = []
+    paths = {dish.image} | {variant.get('path') for variant in load_image_variants(dish)}
+    for path in paths:
+        if path:
+            image_path = os.path.join('static', path)
+            if os.path.exists(image_path):
+                os.remove(image_path)
+                removed.append(path)
+    return removed
 
 # 管理员凭据
 ADMIN_USERNAME = 'chenyaokang'
@@ -124,6 +340,7 @@ class Allergen(db.Model):
     icon = db.Column(db.String(100), nullable=False)
     description_cn = db.Column(db.String(200))
     description_it = db.Column(db.String(200))
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)  # 最后修改时的菜单版本号
 
 # 菜品分类模型
 class Category(db.Model):
@@ -132,6 +349,14 @@ class Category(db.Model):
     name_it = db.Column(db.String(50), nullable=False)
     sort_order = db.Column(db.Integer, default=0)
     prefix_letter = db.Column(db.String(1), nullable=False)  # 分类前缀字母
+    next_dish_number = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # 下一个菜品序号
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)  # 最后修改时的菜单版本号
+    
+    __table_args__ = (
+        db.Index('ix_category_sort_order', 'sort_order'),
+        # 前缀字母用于生成菜品序号，不能重复
+        db.Index('uq_category_prefix_letter', 'prefix_letter', unique=True),
+    )
 
 # 菜品模型
 class Dish(db.Model):
@@ -143,20 +368,32 @@ class Dish(db.Model):
     price = db.Column(db.Float, nullable=False)  # 保留原价格字段作为默认价格
     image = db.Column(db.String(200))  # 本地图片路径
     image_cdn_url = db.Column(db.String(500))  # CDN图片URL
+    image_variants = db.Column(db.Text)  # 多分辨率图片版本（JSON）：[{width, format, path, cdn_url}]
+    image_hash = db.Column(db.String(64), index=True)  # 原始图片内容的SHA-256，用于去重和引用计数
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
     allergens = db.relationship('Allergen', secondary='dish_allergen', backref='dishes')
-    portions = db.relationship('DishPortion', backref='dish', cascade='all, delete-orphan')
+    # 按 (dish_id, sort_order) 排序：预加载多道菜的分量时与索引顺序一致，不需要额外排序
+    portions = db.relationship('DishPortion', backref='dish', cascade='all, delete-orphan',
+                               order_by='[DishPortion.dish_id, DishPortion.sort_order]')
     sort_order = db.Column(db.Integer, default=0)
     surgelato = db.Column(db.Boolean, default=False)  # 冷冻食品标识
     is_popular = db.Column(db.Boolean, default=False)  # 人气菜标识
     is_new = db.Column(db.Boolean, default=False)  # 新菜标识
     is_vegan = db.Column(db.Boolean, default=False)  # 纯素食标识
     spiciness_level = db.Column(db.Integer, default=0)  # 辣度等级：0=不辣，1=微辣🔥，2=中辣🔥🔥，3=特辣🔥🔥🔥
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)  # 最后修改时的菜单版本号
+    
+    __table_args__ = (
+        # 按分类取菜品并按排序号排列：菜单查询、生成序号、重新编号
+        db.Index('ix_dish_category_sort', 'category_id', 'sort_order'),
+    )
 
 # 菜品过敏源关联表
 dish_allergen = db.Table('dish_allergen',
     db.Column('dish_id', db.Integer, db.ForeignKey('dish.id'), primary_key=True),
-    db.Column('allergen_id', db.Integer, db.ForeignKey('allergen.id'), primary_key=True)
+    db.Column('allergen_id', db.Integer, db.ForeignKey('allergen.id'), primary_key=True),
+    # 主键为 (dish_id, allergen_id)，按过敏源反查菜品需要单独的索引
+    db.Index('ix_dish_allergen_allergen_id', 'allergen_id')
 )
 
 # 菜品分量价格模型
@@ -168,14 +405,200 @@ class DishPortion(db.Model):
     price = db.Column(db.Float, nullable=False)  # 该分量的价格
     sort_order = db.Column(db.Integer, default=0)  # 排序
     is_default = db.Column(db.Boolean, default=False)  # 是否为默认分量
+    
+    __table_args__ = (
+        db.Index('ix_dish_portion_dish_sort', 'dish_id', 'sort_order'),
+    )
+
+# 菜单版本模型（只有一行）：每次修改菜单数据时递增，所有工作进程据此判断菜单快照是否过期
+class MenuVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, nullable=False)  # UTC，作为菜单接口的 Last-Modified
+
+# 已删除的菜品、分类、过敏源：增量同步时告诉客户端删除本地数据
+class MenuTombstone(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # dishes / categories / allergens
+    item_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False, index=True)  # 删除时的菜单版本号
+
+# 需要记录修改版本的菜单数据：模型 -> 删除记录中的类型（与增量同步接口中的名称一致）
+MENU_TRACKED_MODELS = {Dish: 'dishes', Category: 'categories', Allergen: 'allergens'}
+
+# 写入数据库前为新增、修改的菜单数据记下版本号，为删除的数据留下删除记录
+# （分量和过敏源关联随菜品一起序列化，修改它们时菜品本身也会被标记为已修改）
+@db.event.listens_for(db.session, 'before_flush')
+def track_menu_changes(session, flush_context, instances):
+    changed = [obj for obj in list(session.new) + list(session.dirty) if type(obj) in MENU_TRACKED_MODELS]
+    deleted = [obj for obj in session.deleted if type(obj) in MENU_TRACKED_MODELS]
+    if not changed and not deleted:
+        return
+    
+    version = pending_menu_version()
+    for obj in changed:
+        obj.version = version
+    for obj in deleted:
+        session.add(MenuTombstone(kind=MENU_TRACKED_MODELS[type(obj)], item_id=obj.id, version=version))
 
-# 主页路由
+# 写入数据库后同步菜品搜索索引：新增、删除的菜品，以及菜名、描述有变化的菜品
+@db.event.listens_for(db.session, 'after_flush')
+def sync_dish_search_index(session, flush_context):
+    changed = [dish for dish in session.new if isinstance(dish, Dish)]
+    changed += [dish for dish in session.dirty if isinstance(dish, Dish) and
+                any(db.inspect(dish).attrs[field].history.has_changes() for field in SEARCH_FIELDS)]
+    deleted = [dish.id for dish in session.deleted if isinstance(dish, Dish)]
+    if not changed and not deleted:
+        return
+    
+    connection = session.connection()
+    if not dish_search_index_ready(connection):
+        return
+    remove_dishes(connection, deleted)
+    index_dishes(connection, [(dish.id, dish.name_cn, dish.name_it, dish.description_it) for dish in changed])
+
+# 事务结束（提交或回滚）后，下一个事务重新分配版本号
+@db.event.listens_for(db.session, 'after_transaction_end')
+def reset_pending_menu_version(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('menu_version', None)
+
+# 图片处理任务模型
+class ImageJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    dish_id = db.Column(db.Integer, db.ForeignKey('dish.id'), nullable=False)
+    filename = db.Column(db.String(300), nullable=False)  # 暂存目录中的原始图片
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending / processing / done / failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    next_run_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        # 后台线程按状态和执行时间抢占任务
+        db.Index('ix_image_job_status_next_run', 'status', 'next_run_at'),
+        db.Index('ix_image_job_dish_id', 'dish_id'),
+    )
+
+# 原始图片丢失、无法解码或任务已取消时重试也不会成功，直接标记为失败
+image_job_queue.init_app(app, db, ImageJob, process_image_job,
+                         permanent_errors=(FileNotFoundError, Image.UnidentifiedImageError,
+                                           Image.DecompressionBombError, ImageJobCancelled),
+                         on_failure=discard_image_job)
+
+# 每个进程在处理第一个请求时启动后台图片任务线程（未完成的任务会继续执行）
+@app.before_request
+def start_image_job_worker():
+    image_job_queue.ensure_started()
+
+# 查询菜单数据：菜品连同分量、过敏源一次性预加载，查询次数与菜品数量无关
+# 排序加上分类ID：按分类排序号索引依次取分类，再按 (category_id, sort_order) 索引取菜品，不需要临时排序
+def query_menu_dishes():
+    return (Dish.query
+            .join(Category)
+            .options(selectinload(Dish.portions), selectinload(Dish.allergens))
+            .order_by(Category.sort_order, Category.id, Dish.sort_order)
+            .all())
+
+def query_menu_categories():
+    return Category.query.order_by(Category.sort_order).all()
+
+def query_menu_allergens():
+    return Allergen.query.order_by(Allergen.id).all()
+
+# 使用某个过敏源的菜品：从关联表的 allergen_id 索引查起，不扫描整个菜品表
+def query_dishes_with_allergen(allergen_id):
+    return (Dish.query
+            .join(dish_allergen, dish_allergen.c.dish_id == Dish.id)
+            .filter(dish_allergen.c.allergen_id == allergen_id)
+            .all())
+
+# 静态文件交给Nginx发送：只返回X-Accel-Redirect头，Nginx负责读文件和预压缩版本（gzip_static）
+def accel_redirect_response(filename):
+    path = safe_join(app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    response = app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.headers['X-Accel-Redirect'] = app.config['STATIC_ACCEL_REDIRECT'].rstrip('/') + '/' + quote(filename)
+    return response
+
+# 静态文件：配置了X-Accel-Redirect时交给Nginx，否则客户端支持时直接返回预压缩好的 .br / .gz 文件
+@app.endpoint('static')
+def static_file(filename):
+    response = None
+    if app.config['STATIC_ACCEL_REDIRECT']:
+        response = accel_redirect_response(filename)
+    else:
+        encoding = negotiate_encoding(request.accept_encodings)
+        path = safe_join(app.static_folder, filename) if encoding else None
+        compressed = precompressed_path(path, encoding) if path and os.path.isfile(path) else None
+        if compressed:
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(app.static_folder, os.path.relpath(compressed, app.static_folder),
+                                           mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+    
+    if response is None:
+        response = app.send_static_file(filename)
+    response.vary.add('Accept-Encoding')
+    # 带内容指纹或按内容哈希命名的文件内容永不改变
+    if is_fingerprinted(filename) or is_content_addressed(filename):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+# 性能指标（Prometheus文本格式），只允许本机或已登录的管理员访问
+@app.route('/metrics')
+def metrics():
+    if request.remote_addr not in ('127.0.0.1', '::1') and not session.get('logged_in'):
+        abort(403)
+    return app.response_class(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# 主页路由：页面内嵌菜单数据，首屏无需再请求API；渲染结果按菜单版本和语言缓存
 @app.route('/')
 def index():
-    categories = Category.query.order_by(Category.sort_order).all()
-    dishes = Dish.query.order_by(Dish.sort_order).all()
-    allergens = Allergen.query.all()
-    return render_template('menu.html', categories=categories, dishes=dishes, allergens=allergens)
+    lang = request.args.get('lang', 'cn')
+    if lang not in ('cn', 'it'):
+        lang = 'cn'
+    
+    snapshot = menu_cache.get()
+    
+    def render():
+        # 转义 "<"，避免菜品文字中出现 </script> 提前结束脚本标签
+        menu_json = snapshot.payloads['menu'].decode('utf-8').replace('<', '\\u003c')
+        return render_template('menu.html', lang=lang, menu_json=Markup(menu_json))
+    
+    html, etag = snapshot.rendered(lang, render)
+    return snapshot_response(snapshot, f'page:{lang}', html, etag, 'text/html')
+
+# Service Worker安装时预先缓存的资源：带指纹的CSS/JS、占位图和过敏源图标
+def service_worker_precache_urls(allergens):
+    filenames = ['css/style.css', 'js/menu.js', 'images/placeholder.jpg'] + [allergen['icon'] for allergen in allergens]
+    return [url_for('static', filename=filename) for filename in filenames]
+
+# 菜品图片所在的其他域名（CDN），Service Worker同样缓存这些图片
+def service_worker_image_origins(dishes):
+    origins = set()
+    for dish in dishes:
+        parts = urlsplit(dish.get('image_cdn') or '')
+        if parts.scheme in ('http', 'https') and parts.netloc:
+            origins.add(f'{parts.scheme}://{parts.netloc}')
+    return sorted(origins)
+
+# 离线缓存的Service Worker：必须从根路径提供，才能控制整个站点
+@app.route('/sw.js')
+def service_worker():
+    snapshot = menu_cache.get()
+    
+    def render():
+        precache_urls = service_worker_precache_urls(json.loads(snapshot.payloads['allergens']))
+        cache_version = content_etag(json.dumps(precache_urls).encode('utf-8'))[:10]
+        image_origins = service_worker_image_origins(json.loads(snapshot.payloads['dishes']))
+        return render_template('sw.js', precache_urls=precache_urls, cache_version=cache_version,
+                               image_origins=image_origins)
+    
+    script, etag = snapshot.rendered('sw', render)
+    return snapshot_response(snapshot, 'sw', script, etag, 'text/javascript')
 
 # 登录页面
 @app.route('/login', methods=['GET', 'POST'])
@@ -205,9 +628,9 @@ def logout():
 @app.route('/admin')
 @login_required
 def admin():
-    categories = Category.query.order_by(Category.sort_order).all()
-    dishes = Dish.query.order_by(Dish.sort_order).all()
-    allergens = Allergen.query.all()
+    categories = query_menu_categories()
+    dishes = query_menu_dishes()
+    allergens = query_menu_allergens()
     return render_template('admin.html', categories=categories, dishes=dishes, allergens=allergens)
 
 
@@ -223,44 +646,23 @@ def add_dish():
     
     category_id = int(data['category_id'])
     
+    # 处理图片上传：只保存原始文件，优化和CDN上传由后台任务完成
+    # 在生成序号之前保存：生成序号会开始写事务，写文件期间不占用SQLite写锁
+    spooled_image = None
+    if 'image' in request.files:
+        file = request.files['image']
+        if file and file.filename:
+            spooled_image = spool_uploaded_image(file)
+            if spooled_image is None:
+                return jsonify({'success': False, 'message': '无法识别的图片文件，请上传JPG、PNG等图片'})
+    
     # 自动生成菜品序号
     dish_number = generate_dish_number(category_id)
     if not dish_number:
+        if spooled_image:
+            remove_spooled_image(spooled_image)
         return jsonify({'success': False, 'message': '无法生成菜品序号，请检查分类设置'})
     
-    # 处理图片上传
-    image_path = None
-    image_cdn_url = None
-    
-    if 'image' in request.files:
-        file = request.files['image']
-        if file and file.filename:
-            filename = secure_filename(file.filename)
-            # 生成唯一文件名
-            unique_filename = f"{uuid.uuid4()}_{filename}"
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(file_path)
-            
-            # 尝试上传到CDN
-            if CDN_AVAILABLE and cdn_service and cdn_service.is_enabled():
-                cdn_url = cdn_service.optimize_and_upload(file_path, unique_filename)
-                if cdn_url:
-                    image_cdn_url = cdn_url
-                    # 如果CDN上传成功且不需要本地备份，删除本地文件
-                    if not Config.LOCAL_BACKUP:
-                        os.remove(file_path)
-                        image_path = None
-                    else:
-                        image_path = f"images/{unique_filename}"
-                else:
-                    # CDN上传失败，使用本地文件
-                    optimize_uploaded_image(file_path, max_width=350, quality=75)
-                    image_path = f"images/{unique_filename}"
-            else:
-                # CDN未配置或不可用，使用本地文件
-                optimize_uploaded_image(file_path, max_width=350, quality=75)
-                image_path = f"images/{unique_filename}"
-    
     # 创建菜品
     dish = Dish(
         dish_number=dish_number,
@@ -268,8 +670,6 @@ def add_dish():
         name_it=data['name_it'],
         description_it=data.get('description_it', ''),
         price=float(data['price']),
-        image=image_path,
-        image_cdn_url=image_cdn_url,
         category_id=category_id,
         surgelato=data.get('surgelato') == 'on',  # 复选框返回'on'或None
         is_popular=data.get('is_popular') == 'on',  # 人气菜标识
@@ -308,7 +708,16 @@ def add_dish():
         if allergen:
             dish.allergens.append(allergen)
     
-    db.session.commit()
+    image_job = None
+    if spooled_image:
+        image_job = image_job_queue.enqueue(dish_id=dish.id, filename=spooled_image)
+    
+    commit_menu_changes()
+    
+    if image_job:
+        image_job_queue.notify()
+        return jsonify({'success': True, 'message': f'菜品添加成功，序号为 {dish_number}，图片正在后台处理',
+                        'image_job_id': image_job.id})
     return jsonify({'success': True, 'message': f'菜品添加成功，序号为 {dish_number}'})
 
 # 编辑菜品
@@ -325,40 +734,14 @@ def edit_dish(dish_id):
     new_category_id = int(data['category_id'])
     old_category_id = dish.category_id
     
-    # 处理图片上传
+    # 处理图片上传：新图片处理完成前继续显示旧图片（任务在其他修改都成功后再创建）
+    spooled_image = None
     if 'image' in request.files:
         file = request.files['image']
         if file and file.filename:
-            # 删除旧图片
-            if dish.image:
-                old_image_path = os.path.join('static', dish.image)
-                if os.path.exists(old_image_path):
-                    os.remove(old_image_path)
-            
-            # 保存新图片
-            filename = secure_filename(file.filename)
-            unique_filename = f"{uuid.uuid4()}_{filename}"
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(file_path)
-            
-            # 尝试上传到CDN
-            if CDN_AVAILABLE and cdn_service and cdn_service.is_enabled():
-                cdn_url = cdn_service.optimize_and_upload(file_path, unique_filename)
-                if cdn_url:
-                    dish.image_cdn_url = cdn_url
-                    if not Config.LOCAL_BACKUP:
-                        os.remove(file_path)
-                        dish.image = None
-                    else:
-                        dish.image = f"images/{unique_filename}"
-                else:
-                    # CDN上传失败，使用本地文件
-                    optimize_uploaded_image(file_path, max_width=350, quality=75)
-                    dish.image = f"images/{unique_filename}"
-            else:
-                # CDN未配置或不可用，使用本地文件
-                optimize_uploaded_image(file_path, max_width=350, quality=75)
-                dish.image = f"images/{unique_filename}"
+            spooled_image = spool_uploaded_image(file)
+            if spooled_image is None:
+                return jsonify({'success': False, 'message': '无法识别的图片文件，请上传JPG、PNG等图片'})
     
     # 更新菜品信息
     dish.name_cn = data['name_cn']
@@ -374,9 +757,12 @@ def edit_dish(dish_id):
     
     # 如果分类改变，重新生成序号
     if old_category_id != new_category_id:
-        dish.dish_number = generate_dish_number(new_category_id)
-        if not dish.dish_number:
+        dish_number = generate_dish_number(new_category_id)
+        if not dish_number:
+            if spooled_image:
+                remove_spooled_image(spooled_image)
             return jsonify({'success': False, 'message': '无法生成菜品序号，请检查分类设置'})
+        dish.dish_number = dish_number
         
         # 重新排序旧分类的菜品
         if old_category_id:
@@ -413,26 +799,51 @@ def edit_dish(dish_id):
         if allergen:
             dish.allergens.append(allergen)
     
-    db.session.commit()
+    image_job = None
+    if spooled_image:
+        image_job = image_job_queue.enqueue(dish_id=dish.id, filename=spooled_image)
+    
+    commit_menu_changes()
+    
+    if image_job:
+        image_job_queue.notify()
+        return jsonify({'success': True, 'message': '菜品更新成功，图片正在后台处理', 'image_job_id': image_job.id})
     return jsonify({'success': True, 'message': '菜品更新成功'})
 
+# 查询图片处理任务状态
+@app.route('/api/image-job/<int:job_id>')
+@login_required
+def get_image_job(job_id):
+    job = ImageJob.query.get_or_404(job_id)
+    return jsonify({
+        'success': True,
+        'job': {
+            'id': job.id,
+            'dish_id': job.dish_id,
+            'status': job.status,
+            'attempts': job.attempts,
+            'error': job.error
+        }
+    })
+
 # 删除菜品图片
 @app.route('/api/dish/<int:dish_id>/image', methods=['DELETE'])
 @login_required
 def delete_dish_image(dish_id):
     dish = Dish.query.get_or_404(dish_id)
     
-    if not dish.image:
+    if not dish.image and not dish.image_cdn_url:
         return jsonify({'success': False, 'message': '该菜品没有图片'})
     
     # 删除图片文件
-    image_path = os.path.join('static', dish.image)
-    if os.path.exists(image_path):
-        os.remove(image_path)
+    remove_dish_image_files(dish)
     
-    # 清空数据库中的图片路径
+    # 清空数据库中的图片路径（包括CDN地址，否则开启CDN时仍会显示已删除的图片）
     dish.image = None
-    db.session.commit()
+    dish.image_cdn_url = None
+    dish.image_variants = None
+    dish.image_hash = None
+    commit_menu_changes()
     
     return jsonify({'success': True, 'message': '图片删除成功'})
 
@@ -444,75 +855,288 @@ def delete_dish(dish_id):
     category_id = dish.category_id
     
     # 删除图片文件
-    if dish.image:
-        image_path = os.path.join('static', dish.image)
-        if os.path.exists(image_path):
-            os.remove(image_path)
+    remove_dish_image_files(dish)
+    
+    # 取消未完成的图片任务：SQLite可能把被删菜品的ID分配给新菜品，旧任务不能把图片写到新菜品上
+    cancelled_jobs = ImageJob.query.filter(ImageJob.dish_id == dish_id,
+                                           ImageJob.status.in_(('pending', 'processing'))).all()
+    for job in cancelled_jobs:
+        job.status = 'failed'
+        job.error = '菜品已删除'
+        job.updated_at = datetime.utcnow()
     
     db.session.delete(dish)
-    db.session.commit()
     
-    # 重新排序该分类下的所有菜品
+    # 重新排序该分类下的所有菜品，与删除在同一个事务中提交
     if category_id:
         reorder_dishes_in_category(category_id)
+    cancelled_files = [job.filename for job in cancelled_jobs]
+    commit_menu_changes()
+    
+    for filename in cancelled_files:
+        remove_spooled_image(filename)
     
     return jsonify({'success': True, 'message': '菜品删除成功'})
 
+# 检查拖拽排序提交的ID列表：必须恰好包含现有的全部ID，各出现一次
+def is_complete_ordering(ids, existing_ids):
+    return (isinstance(ids, list)
+            and all(isinstance(item_id, int) for item_id in ids)
+            and len(ids) == len(existing_ids)
+            and set(ids) == set(existing_ids))
+
+# 按列表顺序批量写入排序号：一条 executemany 更新，由调用方提交
+def apply_sort_order(model, ids):
+    version = pending_menu_version()
+    db.session.execute(db.update(model), [
+        {'id': item_id, 'sort_order': position, 'version': version} for position, item_id in enumerate(ids, 1)
+    ])
+
+# 批量调整分类下的菜品顺序（后台拖拽排序，一次拖拽一个请求）
+@app.route('/api/dishes/order', methods=['PUT'])
+@login_required
+def reorder_dishes():
+    data = request.get_json(silent=True) or {}
+    category = db.session.get(Category, data.get('category_id')) if isinstance(data.get('category_id'), int) else None
+    if not category:
+        return jsonify({'success': False, 'message': '分类不存在'}), 400
+    
+    dish_ids = data.get('dish_ids')
+    existing_ids = db.session.scalars(db.select(Dish.id).where(Dish.category_id == category.id)).all()
+    if not is_complete_ordering(dish_ids, existing_ids):
+        return jsonify({'success': False, 'message': '菜品列表已变化，请刷新页面后重试'}), 409
+    
+    # 排序号、菜品序号和计数器在同一个事务中更新，只提交一次、只让缓存失效一次
+    apply_sort_order(Dish, dish_ids)
+    reorder_dishes_in_category(category.id)
+    commit_menu_changes()
+    
+    return jsonify({'success': True, 'message': '菜品排序已保存'})
+
+# 图片版本的访问URL（优先使用CDN）
+def image_variant_url(variant):
+    return variant.get('cdn_url') or f"/static/{variant['path']}"
+
+# 序列化菜品
+# inline_allergens=False 时只输出过敏源ID列表（供 /api/menu 去重使用）
+def serialize_dish(dish, inline_allergens=True):
+    # 分量已按 sort_order 在SQL中排好序
+    portions = [{
+        'id': portion.id,
+        'name_cn': portion.portion_name_cn,
+        'name_it': portion.portion_name_it,
+        'price': portion.price,
+        'is_default': portion.is_default
+    } for portion in dish.portions]
+    
+    # 确定图片URL（优先使用CDN）
+    image_url = dish.image_cdn_url if dish.image_cdn_url else dish.image
+    
+    # 多分辨率、多格式版本，供前端输出 <picture> 的 srcset/sizes
+    variants = load_image_variants(dish)
+    jpeg_variants = variants_of_format(variants)
+    
+    data = {
+        'id': dish.id,
+        'dish_number': dish.dish_number,
+        'name_cn': dish.name_cn,
+        'name_it': dish.name_it,
+        'description_it': dish.description_it,
+        'price': dish.price,
+        'image': image_url,
+        'image_local': dish.image,
+        'image_cdn': dish.image_cdn_url,
+        'image_srcset': build_srcset(jpeg_variants, image_variant_url) if jpeg_variants else None,
+        'image_sizes': IMAGE_SIZES if jpeg_variants else None,
+        'image_sources': build_sources(variants, image_variant_url),
+        'category_id': dish.category_id,
+        'sort_order': dish.sort_order,
+        'surgelato': dish.surgelato,
+        'is_popular': dish.is_popular,
+        'is_new': dish.is_new,
+        'is_vegan': dish.is_vegan,
+        'spiciness_level': dish.spiciness_level,
+        'portions': portions
+    }
+    if inline_allergens:
+        data['allergens'] = [{'id': a.id, 'name_cn': a.name_cn, 'name_it': a.name_it, 'icon': a.icon} for a in dish.allergens]
+    else:
+        data['allergen_ids'] = [a.id for a in dish.allergens]
+    return data
+
+# 序列化分类
+def serialize_category(category):
+    return {
+        'id': category.id,
+        'name_cn': category.name_cn,
+        'name_it': category.name_it,
+        'sort_order': category.sort_order,
+        'prefix_letter': category.prefix_letter
+    }
+
+# 序列化过敏源
+def serialize_allergen(allergen):
+    return {
+        'id': allergen.id,
+        'name_cn': allergen.name_cn,
+        'name_it': allergen.name_it,
+        'icon': allergen.icon,
+        'description_cn': allergen.description_cn,
+        'description_it': allergen.description_it
+    }
+
+# 构建菜单快照数据（仅在菜单版本变化后执行一次）
+def build_menu_payloads():
+    # 先读版本号再读数据：读取期间有新的修改时，客户端增量同步会再取一次，不会漏掉
+    version, _ = read_menu_version()
+    dishes = query_menu_dishes()
+    categories = [serialize_category(category) for category in query_menu_categories()]
+    allergens = [serialize_allergen(allergen) for allergen in query_menu_allergens()]
+    return {
+        'dishes': [serialize_dish(dish) for dish in dishes],
+        'categories': categories,
+        'allergens': allergens,
+        # 顾客菜单页一次性加载的合并数据，菜品中的过敏源只引用ID
+        'menu': {
+            'version': version,
+            'categories': categories,
+            'allergens': allergens,
+            'dishes': [serialize_dish(dish, inline_allergens=False) for dish in dishes]
+        }
+    }
+
+menu_cache.init_builder(build_menu_payloads, read_menu_version)
+
+# 返回菜单快照中的内容：按 Accept-Encoding 选择已缓存的压缩版本，并支持条件请求
+def snapshot_response(snapshot, key, data, etag, mimetype):
+    encoding = negotiate_encoding(request.accept_encodings) if len(data) >= MIN_COMPRESS_SIZE else None
+    if encoding:
+        data = snapshot.compressed(key, data, encoding)
+        # 不同编码是不同的表示，使用不同的强ETag
+        etag = f'{etag}-{encoding}'
+    
+    response = app.response_class(data, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.last_modified = snapshot.last_modified
+    # Service Worker据此判断缓存中的菜单是否已是最新版本
+    response.headers['X-Menu-Version'] = str(snapshot.version)
+    # 浏览器和CDN可以缓存，但每次使用前都需要用ETag重新验证
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+# 从菜单快照返回预序列化的JSON，支持 If-None-Match / If-Modified-Since 条件请求
+def menu_json_response(name):
+    snapshot = menu_cache.get()
+    return snapshot_response(snapshot, name, snapshot.payloads[name], snapshot.etags[name], 'application/json')
+
+# 获取完整菜单数据：分类、过敏源和菜品（API）
+@app.route('/api/menu')
+def get_menu():
+    return menu_json_response('menu')
+
+# 增量同步：返回某个菜单版本之后新增、修改和删除的数据，格式与 /api/menu 相同
+@app.route('/api/menu/changes')
+def get_menu_changes():
+    since = request.args.get('since', type=int)
+    version, _ = read_menu_version()
+    if since is None or since < 0 or since > version:
+        # 客户端的版本号无效（如数据库已恢复备份），需要重新加载完整菜单
+        return jsonify({'version': version, 'reset': True})
+    
+    changes = {
+        'version': version,
+        'categories': [],
+        'allergens': [],
+        'dishes': [],
+        'deleted': {'categories': [], 'allergens': [], 'dishes': []}
+    }
+    if since == version:
+        return jsonify(changes)
+    
+    changes['categories'] = [serialize_category(category) for category in
+                             Category.query.filter(Category.version > since).order_by(Category.sort_order)]
+    changes['allergens'] = [serialize_allergen(allergen) for allergen in
+                            Allergen.query.filter(Allergen.version > since).order_by(Allergen.id)]
+    dishes = (Dish.query
+              .options(selectinload(Dish.portions), selectinload(Dish.allergens))
+              .filter(Dish.version > since)
+              .all())
+    changes['dishes'] = [serialize_dish(dish, inline_allergens=False) for dish in dishes]
+    for tombstone in MenuTombstone.query.filter(MenuTombstone.version > since).order_by(MenuTombstone.version):
+        changes['deleted'][tombstone.kind].append(tombstone.item_id)
+    return jsonify(changes)
+
+# 菜品搜索默认和最多返回的数量
+SEARCH_LIMIT = 50
+SEARCH_MAX_LIMIT = 200
+
+# 只有SQLite且已创建搜索表时才维护索引（非SQLite数据库的搜索使用LIKE查询）
+def dish_search_index_ready(connection):
+    return is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']) and search_index_exists(connection)
+
+def create_dish_search_index():
+    """
+    创建菜品全文搜索索引（仅SQLite），已存在时不做修改
+    :return: 新建时写入的菜品数，已存在或无法创建时返回None
+    """
+    if not is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        return None
+    try:
+        with db.engine.begin() as conn:
+            return create_search_index(conn)
+    except OperationalError as e:
+        # 如SQLite编译时没有启用FTS5，搜索会使用LIKE查询
+        print(f"⚠️  无法创建菜品搜索索引: {e}")
+        return None
+
+def like_search_dish_ids(query, limit):
+    """
+    没有全文索引时（非SQLite数据库、未迁移）的搜索：每个词都必须出现在编号、菜名或描述中
+    :param query: 用户输入
+    :param limit: 最多返回的数量
+    :return: 菜品ID
+    """
+    dishes = Dish.query
+    for term in query[:MAX_QUERY_LENGTH].split()[:MAX_QUERY_TERMS]:
+        dishes = dishes.filter(or_(Dish.dish_number.icontains(term, autoescape=True),
+                                   Dish.name_cn.icontains(term, autoescape=True),
+                                   Dish.name_it.icontains(term, autoescape=True),
+                                   Dish.description_it.icontains(term, autoescape=True)))
+    return [dish_id for dish_id, in
+            dishes.with_entities(Dish.id).order_by(Dish.category_id, Dish.sort_order).limit(limit)]
+
+# 菜品搜索：按相关度返回菜品ID，页面用本地的菜单数据显示结果
+@app.route('/api/search')
+def search_dishes():
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', SEARCH_LIMIT, type=int), SEARCH_MAX_LIMIT))
+    if not query:
+        return jsonify({'query': query, 'ids': []})
+    
+    if is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        try:
+            ids = search_dish_ids(db.session.connection(), query, limit)
+        except OperationalError:
+            # 搜索表不存在（旧数据库未运行迁移）
+            db.session.rollback()
+            ids = like_search_dish_ids(query, limit)
+    else:
+        ids = like_search_dish_ids(query, limit)
+    return jsonify({'query': query, 'ids': ids})
+
 # 获取所有菜品数据（API）
 @app.route('/api/dishes')
 def get_dishes():
-    dishes = Dish.query.join(Category).order_by(Category.sort_order, Dish.sort_order).all()
-    result = []
-    for dish in dishes:
-        # 获取分量信息
-        portions = []
-        for portion in sorted(dish.portions, key=lambda x: x.sort_order):
-            portions.append({
-                'id': portion.id,
-                'name_cn': portion.portion_name_cn,
-                'name_it': portion.portion_name_it,
-                'price': portion.price,
-                'is_default': portion.is_default
-            })
-        
-        # 确定图片URL（优先使用CDN）
-        image_url = dish.image_cdn_url if dish.image_cdn_url else dish.image
-        
-        result.append({
-            'id': dish.id,
-            'dish_number': dish.dish_number,
-            'name_cn': dish.name_cn,
-            'name_it': dish.name_it,
-            'description_it': dish.description_it,
-            'price': dish.price,
-            'image': image_url,
-            'image_local': dish.image,
-            'image_cdn': dish.image_cdn_url,
-            'category_id': dish.category_id,
-            'surgelato': dish.surgelato,
-            'is_popular': dish.is_popular,
-            'is_new': dish.is_new,
-            'is_vegan': dish.is_vegan,
-            'spiciness_level': dish.spiciness_level,
-            'portions': portions,
-            'allergens': [{'id': a.id, 'name_cn': a.name_cn, 'name_it': a.name_it, 'icon': a.icon} for a in dish.allergens]
-        })
-    return jsonify(result)
+    return menu_json_response('dishes')
 
 # 获取所有分类数据（API）
 @app.route('/api/categories')
 def get_categories():
-    categories = Category.query.order_by(Category.sort_order).all()
-    result = []
-    for category in categories:
-        result.append({
-            'id': category.id,
-            'name_cn': category.name_cn,
-            'name_it': category.name_it,
-            'sort_order': category.sort_order,
-            'prefix_letter': category.prefix_letter
-        })
-    return jsonify(result)
+    return menu_json_response('categories')
 
 # 添加分类
 @app.route('/api/category', methods=['POST'])
@@ -532,7 +1156,7 @@ def add_category():
         prefix_letter=data['prefix_letter']
     )
     db.session.add(category)
-    db.session.commit()
+    commit_menu_changes()
     return jsonify({'success': True, 'message': '分类添加成功'})
 
 # 添加过敏源
@@ -548,7 +1172,7 @@ def add_allergen():
         description_it=data.get('description_it', '')
     )
     db.session.add(allergen)
-    db.session.commit()
+    commit_menu_changes()
     return jsonify({'success': True, 'message': '过敏源添加成功'})
 
 # 删除分类
@@ -563,9 +1187,24 @@ def delete_category(category_id):
         return jsonify({'success': False, 'message': f'该分类下还有 {dishes_with_category} 个菜品，无法删除'})
     
     db.session.delete(category)
-    db.session.commit()
+    commit_menu_changes()
     return jsonify({'success': True, 'message': '分类删除成功'})
 
+# 批量调整分类顺序（后台拖拽排序）
+@app.route('/api/categories/order', methods=['PUT'])
+@login_required
+def reorder_categories():
+    data = request.get_json(silent=True) or {}
+    category_ids = data.get('category_ids')
+    existing_ids = db.session.scalars(db.select(Category.id)).all()
+    if not is_complete_ordering(category_ids, existing_ids):
+        return jsonify({'success': False, 'message': '分类列表已变化，请刷新页面后重试'}), 409
+    
+    apply_sort_order(Category, category_ids)
+    commit_menu_changes()
+    
+    return jsonify({'success': True, 'message': '分类排序已保存'})
+
 # 删除过敏源
 @app.route('/api/allergen/<int:allergen_id>', methods=['DELETE'])
 @login_required
@@ -573,34 +1212,25 @@ def delete_allergen(allergen_id):
     allergen = Allergen.query.get_or_404(allergen_id)
     
     # 从所有菜品中移除该过敏源
-    dishes_with_allergen = Dish.query.filter(Dish.allergens.any(id=allergen_id)).all()
+    dishes_with_allergen = query_dishes_with_allergen(allergen_id)
     for dish in dishes_with_allergen:
         dish.allergens.remove(allergen)
     
     db.session.delete(allergen)
-    db.session.commit()
+    commit_menu_changes()
     return jsonify({'success': True, 'message': '过敏源删除成功'})
 
 # 获取所有过敏源数据（API）
 @app.route('/api/allergens')
 def get_allergens():
-    allergens = Allergen.query.all()
-    result = []
-    for allergen in allergens:
-        result.append({
-            'id': allergen.id,
-            'name_cn': allergen.name_cn,
-            'name_it': allergen.name_it,
-            'icon': allergen.icon,
-            'description_cn': allergen.description_cn,
-            'description_it': allergen.description_it
-        })
-    return jsonify(result)
+    return menu_json_response('allergens')
 
 # 初始化数据库
 def init_db():
     with app.app_context():
         db.create_all()
+        # 菜品搜索索引在写入数据之前创建，之后由 sync_dish_search_index（after_flush）同步，不使用触发器
+        create_dish_search_index()
         
         # 初始化一些默认数据
         if not Category.query.first():
@@ -693,6 +1323,11 @@ def init_db():
                 db.session.add(allergen)
         
         db.session.commit()
+        
+        # 写入默认数据时已经生成了版本号，已有的数据库没有时补上
+        if not db.session.get(MenuVersion, 1):
+            db.session.add(MenuVersion(id=1, version=0, changed_at=datetime.utcnow()))
+            db.session.commit()
 
 if __name__ == '__main__':
     init_db()
@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+"""
+菜单压测脚本：模拟晚餐高峰时大量顾客同时扫码打开菜单
+每个虚拟顾客循环执行一次完整的扫码访问：打开主页、请求分类/菜品/过敏源接口、加载若干张菜品图片
+结果保存为JSON，可以对比不同提交之间的性能变化
+"""
+
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, 'benchmark_results')
+
+# 一次扫码访问依次请求的接口
+SESSION_REQUESTS = [
+    ('page', '/'),
+    ('categories', '/api/categories'),
+    ('dishes', '/api/dishes'),
+    ('allergens', '/api/allergens'),
+]
+
+# 每次访问加载的图片数（首屏及滚动时懒加载的图片）
+IMAGES_PER_SESSION = 12
+
+# 正式计时前的预热秒数：各工作进程首次请求时要构建菜单快照并压缩，不计入结果
+WARMUP_SECONDS = 5
+
+# 浏览器请求头
+REQUEST_HEADERS = {
+    'Accept-Encoding': 'gzip, br',
+    'User-Agent': 'menu-benchmark',
+}
+
+
+def seed_database(db_path, dish_count=300, image_count=24):
+    """
+    生成压测用的菜单数据库：每道菜带分量价格、过敏源和多分辨率图片
+    :param db_path: SQLite数据库文件路径
+    :param dish_count: 菜品数量
+    :param image_count: 不同图片的数量（菜品之间共用）
+    :return: 新生成的图片文件列表（压测结束后删除）
+    """
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+    from PIL import Image
+    from app import app, db, init_db, Category, Dish, DishPortion, Allergen
+    from image_pipeline import generate_variants, default_variant, file_sha256, content_base_name
+
+    init_db()
+    rng = random.Random(42)
+    upload_folder = app.config['UPLOAD_FOLDER']
+    existing_files = set(os.listdir(upload_folder))
+
+    # 生成不同颜色的图片，按内容哈希命名，重复运行时文件名不变
+    images = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i in range(image_count):
+            source_path = os.path.join(tmp_dir, f"bench_{i}.jpg")
+            img = Image.new('RGB', (1200, 900), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+            for y in range(0, 900, 30):
+                img.paste((rng.randrange(256), rng.randrange(256), rng.randrange(256)),
+                          (rng.randrange(1200), y, 1200, y + 30))
+            img.save(source_path, 'JPEG', quality=90)
+            image_hash = file_sha256(source_path)
+            variants = generate_variants(source_path, upload_folder, content_base_name(image_hash))
+            records = [{'width': v['width'], 'format': v['format'], 'path': f"images/{v['filename']}", 'cdn_url': None}
+                       for v in variants]
+            images.append((default_variant(records)['path'], json.dumps(records), image_hash))
+
+    with app.app_context():
+        categories = Category.query.order_by(Category.sort_order).all()
+        allergens = Allergen.query.all()
+        for i in range(dish_count):
+            category = categories[i % len(categories)]
+            image, image_variants, image_hash = images[i % len(images)]
+            dish = Dish(dish_number=f"{category.prefix_letter}{i // len(categories) + 1}",
+                        name_cn=f"压测菜品{i + 1}", name_it=f"Piatto di prova {i + 1}",
+                        description_it='Piatto preparato al momento con ingredienti freschi di stagione.',
+                        price=round(rng.uniform(4, 30), 1), category_id=category.id, sort_order=i,
+                        image=image, image_variants=image_variants, image_hash=image_hash,
+                        is_popular=rng.random() < 0.1, spiciness_level=rng.randrange(4))
+            dish.allergens = rng.sample(allergens, rng.randrange(4))
+            if rng.random() < 0.3:
+                dish.portions = [
+                    DishPortion(portion_name_cn='小份', portion_name_it='Piccola', price=dish.price,
+                                sort_order=1, is_default=True),
+                    DishPortion(portion_name_cn='大份', portion_name_it='Grande', price=dish.price + 4,
+                                sort_order=2),
+                ]
+            db.session.add(dish)
+        db.session.commit()
+
+    return [os.path.join(upload_folder, name) for name in os.listdir(upload_folder) if name not in existing_files]
+
+
+def free_port():
+    """获取一个空闲端口"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(db_path, port):
+    """
+    用生产配置启动服务（未安装Gunicorn时使用Flask多线程服务器）
+    :return: (进程对象, 服务器类型)
+    """
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", GUNICORN_BIND=f"127.0.0.1:{port}")
+    try:
+        import gunicorn  # noqa: F401
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+        server = 'gunicorn'
+    except ImportError:
+        command = [sys.executable, '-c',
+                   f"from wsgi import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+        server = 'flask'
+    process = subprocess.Popen(command, cwd=BASE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return process, server
+
+
+def wait_until_ready(host, port, timeout=30):
+    """等待服务可以响应请求"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request('GET', '/api/categories')
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def fetch_image_urls(host, port):
+    """从菜品接口中取出本地图片的URL（CDN上的图片不在压测范围内）"""
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    conn.request('GET', '/api/dishes')
+    dishes = json.loads(conn.getresponse().read())
+    urls = set()
+    for dish in dishes:
+        for url in [dish.get('image')] + [src.split()[0] for src in (dish.get('image_srcset') or '').split(', ') if src]:
+            if url and url.startswith('/'):
+                urls.add(url)
+            elif url and not url.startswith('http'):
+                urls.add(f"/static/{url}")
+    return sorted(urls)
+
+
+def percentile(sorted_values, percent):
+    """按最近秩法计算百分位数"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(percent / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class LoadGenerator:
+    """多线程压测：每个线程是一个虚拟顾客，不停重复完整的扫码访问"""
+
+    def __init__(self, host, port, concurrency, duration, image_urls, images_per_session=IMAGES_PER_SESSION):
+        self.host = host
+        self.port = port
+        self.concurrency = concurrency
+        self.duration = duration
+        self.image_urls = image_urls
+        self.images_per_session = images_per_session
+        self.samples = []
+        self.sessions = 0
+        self._lock = threading.Lock()
+
+    def _request(self, conn, path):
+        started = time.perf_counter()
+        # 服务端关闭了空闲的长连接时，和浏览器一样重新连接再试一次
+        for attempt in range(2):
+            try:
+                conn.request('GET', path, headers=REQUEST_HEADERS)
+                response = conn.getresponse()
+                body = response.read()
+                return time.perf_counter() - started, response.status < 400, len(body)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                break
+        return time.perf_counter() - started, False, 0
+
+    def _customer(self, deadline, seed):
+        rng = random.Random(seed)
+        samples = []
+        sessions = 0
+        while time.time() < deadline:
+            # 每次扫码是一个新的浏览器连接，访问期间保持长连接
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            requests = list(SESSION_REQUESTS)
+            if self.image_urls:
+                requests += [('image', rng.choice(self.image_urls)) for _ in range(self.images_per_session)]
+            for name, path in requests:
+                elapsed, ok, size = self._request(conn, path)
+                samples.append((name, elapsed, ok, size))
+            conn.close()
+            sessions += 1
+        with self._lock:
+            self.samples.extend(samples)
+            self.sessions += sessions
+
+    def run(self):
+        deadline = time.time() + self.duration
+        threads = [threading.Thread(target=self._customer, args=(deadline, i)) for i in range(self.concurrency)]
+        started = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.time() - started)
+
+    def report(self, elapsed):
+        """汇总吞吐量和各接口的延迟分布"""
+        def summarize(samples):
+            latencies = sorted(sample[1] * 1000 for sample in samples)
+            errors = sum(1 for sample in samples if not sample[2])
+            return {
+                'requests': len(samples),
+                'errors': errors,
+                'requests_per_sec': round(len(samples) / elapsed, 1),
+                'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+                'p50_ms': round(percentile(latencies, 50), 2),
+                'p95_ms': round(percentile(latencies, 95), 2),
+                'p99_ms': round(percentile(latencies, 99), 2),
+                'bytes_per_request': int(sum(sample[3] for sample in samples) / len(samples)) if samples else 0,
+            }
+
+        endpoints = {}
+        for name in [name for name, _ in SESSION_REQUESTS] + ['image']:
+            samples = [sample for sample in self.samples if sample[0] == name]
+            if samples:
+                endpoints[name] = summarize(samples)
+        summary = summarize(self.samples)
+        summary['sessions'] = self.sessions
+        summary['sessions_per_sec'] = round(self.sessions / elapsed, 1)
+        summary['elapsed_sec'] = round(elapsed, 2)
+        return {'summary': summary, 'endpoints': endpoints}
+
+
+def git_commit():
+    """当前代码的提交号"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result):
+    meta = result['meta']
+    summary = result['summary']
+    print(f"\n📊 压测结果（{meta['server']}，并发 {meta['concurrency']}，{meta['duration']} 秒，提交 {meta['commit']}）")
+    print(f"{'接口':<12}{'请求数':>8}{'错误':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'平均字节':>10}")
+    for name, stats in list(result['endpoints'].items()) + [('总计', summary)]:
+        print(f"{name:<12}{stats['requests']:>8}{stats['errors']:>6}{stats['requests_per_sec']:>9}"
+              f"{stats['p50_ms']:>8}ms{stats['p95_ms']:>7}ms{stats['p99_ms']:>7}ms{stats['bytes_per_request']:>10}")
+    print(f"完整扫码访问: {summary['sessions']} 次，{summary['sessions_per_sec']} 次/秒")
+
+
+def save_result(result, output=None):
+    """保存压测结果，默认按时间和提交号命名"""
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}_{result['meta']['commit'] or 'nogit'}.json")
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
+    print(f"💾 结果已保存: {output}")
+    return output
+
+
+def run_load(host, port, concurrency, duration, meta):
+    image_urls = fetch_image_urls(host, port)
+    print(f"🔥 预热 {WARMUP_SECONDS} 秒...")
+    LoadGenerator(host, port, concurrency, WARMUP_SECONDS, image_urls).run()
+    print(f"🚀 开始压测：{concurrency} 个并发顾客，持续 {duration} 秒，图片 {len(image_urls)} 张")
+    result = LoadGenerator(host, port, concurrency, duration, image_urls).run()
+    result['meta'] = dict(meta, concurrency=concurrency, duration=duration, commit=git_commit(),
+                          timestamp=datetime.now().isoformat(timespec='seconds'),
+                          images_per_session=IMAGES_PER_SESSION, warmup=WARMUP_SECONDS, python=sys.version.split()[0])
+    print_report(result)
+    return result
+
+
+def run_benchmark(concurrency=50, duration=30, dish_count=300, output=None):
+    """
+    建立压测数据库、启动服务并压测
+    :param concurrency: 并发顾客数
+    :param duration: 持续秒数
+    :param dish_count: 菜品数量
+    :param output: 结果文件路径（可选）
+    """
+    work_dir = tempfile.mkdtemp(prefix='menu-benchmark-')
+    db_path = os.path.join(work_dir, 'menu.db')
+    created_files = []
+    process = None
+    try:
+        print(f"🌱 生成压测数据：{dish_count} 道菜...")
+        created_files = seed_database(db_path, dish_count)
+
+        port = free_port()
+        process, server = start_server(db_path, port)
+        if not wait_until_ready('127.0.0.1', port):
+            print("❌ 服务启动失败")
+            return None
+
+        result = run_load('127.0.0.1', port, concurrency, duration,
+                          {'server': server, 'dishes': dish_count, 'target': 'local'})
+        save_result(result, output)
+        return result
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        for path in created_files:
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_against_url(url, concurrency=50, duration=30, output=None):
+    """压测已在运行的服务（如预发布环境）"""
+    parts = urlsplit(url)
+    if parts.scheme != 'http':
+        print("❌ 只支持 http:// 地址（请直接压测Gunicorn或内网Nginx）")
+        return None
+    result = run_load(parts.hostname, parts.port or 80, concurrency, duration,
+                      {'server': 'external', 'dishes': None, 'target': url})
+    save_result(result, output)
+    return result
+
+
+def _contention_reader(deadline, results):
+    """读进程：不停查询完整菜单，模拟另一个Gunicorn工作进程重建菜单快照"""
+    from sqlalchemy.exc import OperationalError
+    from app import app, db, query_menu_dishes
+
+    latencies = []
+    errors = 0
+    with app.app_context():
+        # 不复用父进程的SQLite连接
+        db.engine.dispose()
+        while time.time() < deadline:
+            started = time.perf_counter()
+            try:
+                len(query_menu_dishes())
+            except OperationalError:
+                errors += 1
+            finally:
+                # 结束读事务，释放共享锁
+                db.session.remove()
+            latencies.append((time.perf_counter() - started) * 1000)
+    results.put((latencies, errors))
+
+
+def run_contention(readers=4, duration=15, dish_count=300, output=None):
+    """
+    读写并发测试：一个线程不停通过 edit_dish 编辑菜品并提交，
+    同时多个读进程（相当于其他Gunicorn工作进程）查询完整菜单，统计读取延迟和 database is locked 错误。
+    用 SQLITE_TUNING=0 再运行一次即可与未优化的SQLite配置对比
+    :param readers: 读进程数
+    :param duration: 持续秒数
+    :param dish_count: 菜品数量
+    :param output: 结果文件路径（可选）
+    """
+    import multiprocessing
+
+    work_dir = tempfile.mkdtemp(prefix='menu-benchmark-')
+    db_path = os.path.join(work_dir, 'menu.db')
+    created_files = []
+    try:
+        print(f"🌱 生成压测数据：{dish_count} 道菜...")
+        created_files = seed_database(db_path, dish_count)
+
+        from app import app, db, Dish
+        from database import SQLITE_TUNING, sqlite_settings
+
+        with app.app_context():
+            dishes = [(dish.id, dish.category_id, dish.name_cn, dish.name_it, dish.price) for dish in Dish.query.all()]
+            settings = sqlite_settings(db.session.connection())
+            db.engine.dispose()
+        print(f"⚙️  SQLite设置: {settings}")
+
+        print(f"🚀 开始读写并发测试：1 个写线程，{readers} 个读进程，持续 {duration} 秒")
+        deadline = time.time() + duration
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [context.Process(target=_contention_reader, args=(deadline, results)) for _ in range(readers)]
+        for process in processes:
+            process.start()
+
+        counts = {'writes': 0, 'write_errors': 0}
+        write_latencies = []
+        client = app.test_client()
+        with client.session_transaction() as flask_session:
+            flask_session['logged_in'] = True
+        rng = random.Random(1)
+        while time.time() < deadline:
+            dish_id, category_id, name_cn, name_it, price = rng.choice(dishes)
+            started = time.perf_counter()
+            response = client.put(f'/api/dish/{dish_id}', data={
+                'category_id': str(category_id), 'name_cn': name_cn, 'name_it': name_it,
+                'price': str(round(price + rng.uniform(-1, 1), 1)),
+            })
+            write_latencies.append((time.perf_counter() - started) * 1000)
+            ok = response.status_code == 200 and response.get_json().get('success')
+            counts['writes' if ok else 'write_errors'] += 1
+
+        latencies = []
+        read_errors = 0
+        for _ in processes:
+            process_latencies, errors = results.get()
+            latencies.extend(process_latencies)
+            read_errors += errors
+        for process in processes:
+            process.join()
+
+        latencies.sort()
+        write_latencies.sort()
+        result = {
+            'meta': {'scenario': 'contention', 'readers': readers, 'duration': duration, 'dishes': dish_count,
+                     'sqlite_tuning': SQLITE_TUNING, 'sqlite_settings': settings, 'commit': git_commit(),
+                     'timestamp': datetime.now().isoformat(timespec='seconds'), 'python': sys.version.split()[0]},
+            'summary': dict(counts,
+                            reads=len(latencies) - read_errors,
+                            read_errors=read_errors,
+                            reads_per_sec=round((len(latencies) - read_errors) / duration, 1),
+                            writes_per_sec=round(counts['writes'] / duration, 1),
+                            write_p50_ms=round(percentile(write_latencies, 50), 2),
+                            write_p99_ms=round(percentile(write_latencies, 99), 2),
+                            read_p50_ms=round(percentile(latencies, 50), 2),
+                            read_p95_ms=round(percentile(latencies, 95), 2),
+                            read_p99_ms=round(percentile(latencies, 99), 2),
+                            read_max_ms=round(latencies[-1], 2) if latencies else 0.0),
+        }
+        summary = result['summary']
+        print(f"\n📊 读写并发结果（SQLITE_TUNING={'1' if SQLITE_TUNING else '0'}）")
+        print(f"写入: {summary['writes']} 次（{summary['writes_per_sec']}/秒），失败 {summary['write_errors']} 次，"
+              f"p50 {summary['write_p50_ms']}ms  p99 {summary['write_p99_ms']}ms")
+        print(f"读取: {summary['reads']} 次（{summary['reads_per_sec']}/秒），失败 {summary['read_errors']} 次")
+        print(f"读取延迟: p50 {summary['read_p50_ms']}ms  p95 {summary['read_p95_ms']}ms  "
+              f"p99 {summary['read_p99_ms']}ms  最大 {summary['read_max_ms']}ms")
+        save_result(result, output)
+        return result
+    finally:
+        for path in created_files:
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare_results(old_path, new_path, threshold=10):
+    """
+    对比两次压测结果
+    :param threshold: 吞吐量下降或p95上升超过该百分比时标记为退化
+    :return: 是否存在退化
+    """
+    with open(old_path, encoding='utf-8') as file:
+        old = json.load(file)
+    with open(new_path, encoding='utf-8') as file:
+        new = json.load(file)
+
+    def change(before, after):
+        return (after - before) / before * 100 if before else 0.0
+
+    print(f"📊 {old['meta']['commit']} → {new['meta']['commit']}")
+    print(f"{'接口':<12}{'req/s':>22}{'p95':>26}")
+    regressed = False
+    rows = [(name, old['endpoints'][name], new['endpoints'][name])
+            for name in new['endpoints'] if name in old['endpoints']]
+    rows.append(('总计', old['summary'], new['summary']))
+    for name, before, after in rows:
+        rps_change = change(before['requests_per_sec'], after['requests_per_sec'])
+        p95_change = change(before['p95_ms'], after['p95_ms'])
+        flag = ''
+        if rps_change < -threshold or p95_change > threshold:
+            flag = ' ⚠️  退化'
+            regressed = True
+        print(f"{name:<12}{before['requests_per_sec']:>8} → {after['requests_per_sec']:<8}({rps_change:+.0f}%)"
+              f"{before['p95_ms']:>8}ms → {after['p95_ms']}ms ({p95_change:+.0f}%){flag}")
+    return regressed
+
+
+def main():
+    """主函数"""
+    if len(sys.argv) < 2:
+        print("使用方法:")
+        print("  python benchmark.py run [并发数] [持续秒数] [菜品数]     # 生成数据、启动服务并压测")
+        print("  python benchmark.py url <地址> [并发数] [持续秒数]       # 压测已运行的服务")
+        print("  python benchmark.py contention [读进程数] [持续秒数]     # 编辑菜品时其他进程的读取是否被阻塞")
+        print("  python benchmark.py compare <旧结果.json> <新结果.json>  # 对比两次结果")
+        return
+
+    command = sys.argv[1].lower()
+
+    if command == 'run':
+        concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+        duration = int(sys.argv[3]) if len(sys.argv) > 3 else 30
+        dish_count = int(sys.argv[4]) if len(sys.argv) > 4 else 300
+        run_benchmark(concurrency, duration, dish_count)
+    elif command == 'url' and len(sys.argv) > 2:
+        concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+        duration = int(sys.argv[4]) if len(sys.argv) > 4 else 30
+        run_against_url(sys.argv[2], concurrency, duration)
+    elif command == 'contention':
+        readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+        duration = int(sys.argv[3]) if len(sys.argv) > 3 else 15
+        run_contention(readers, duration)
+    elif command == 'compare' and len(sys.argv) > 3:
+        sys.exit(1 if compare_results(sys.argv[2], sys.argv[3]) else 0)
+    else:
+        print(f"❌ 未知命令或缺少参数: {command}")
+        print("可用命令: run, url, contention, compare")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,73 @@
 # cdn_service.py
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from PIL import Image
-import oss2
 from config import Config
 
+# 只使用本地模拟存储时不需要安装oss2
+try:
+    import oss2
+except ImportError:
+    oss2 = None
+
+# 上传图片时使用的Content-Type
+IMAGE_CONTENT_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.webp': 'image/webp',
+    '.avif': 'image/avif',
+}
+
+class LocalBucketResult:
+    """模拟oss2请求结果"""
+    
+    def __init__(self, status):
+        self.status = status
+    
+    def __repr__(self):
+        return f"LocalBucketResult(status={self.status})"
+
+
+class LocalBucket:
+    """
+    本地目录模拟的OSS存储桶
+    实现CDNService用到的 put_object / delete_object / object_exists，便于离线测试和演练迁移
+    """
+    
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+    
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"非法的对象名: {key}")
+        return path
+    
+    def put_object(self, key, data, headers=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if hasattr(data, 'read'):
+            data = data.read()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+        return LocalBucketResult(200)
+    
+    def delete_object(self, key):
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+        return LocalBucketResult(204)
+    
+    def object_exists(self, key):
+        return os.path.exists(self._path(key))
+
+
 class CDNService:
     """CDN服务类"""
     
@@ -14,7 +76,15 @@ class CDNService:
         self.bucket = None
         self.cdn_domain = Config.CDN_DOMAIN
         
-        if Config.is_cdn_enabled():
+        if Config.OSS_LOCAL_DIR:
+            # 使用本地目录模拟OSS
+            self.bucket = LocalBucket(Config.OSS_LOCAL_DIR)
+            if not self.cdn_domain:
+                self.cdn_domain = f"file://{self.bucket.root}"
+        elif Config.is_cdn_enabled():
+            if oss2 is None:
+                print("⚠️  未安装oss2，CDN服务不可用")
+                return
             self.auth = oss2.Auth(Config.OSS_ACCESS_KEY_ID, Config.OSS_ACCESS_KEY_SECRET)
             self.bucket = oss2.Bucket(self.auth, Config.OSS_ENDPOINT, Config.OSS_BUCKET_NAME)
     
@@ -22,11 +92,12 @@ class CDNService:
         """检查CDN服务是否可用"""
         return self.bucket is not None
     
-    def upload_image(self, file_path, filename=None):
+    def upload_image(self, file_path, filename=None, cache_control=None):
         """
         上传图片到CDN
         :param file_path: 本地图片路径
         :param filename: 文件名（可选）
+        :param cache_control: 对象的Cache-Control（可选）
         :return: CDN URL或None
         """
         if not self.is_enabled():
@@ -38,12 +109,15 @@ class CDNService:
                 filename = f"{uuid.uuid4()}.jpg"
             
             # 确保文件名有扩展名
-            if not filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+            if not filename.lower().endswith(tuple(IMAGE_CONTENT_TYPES)):
                 filename += '.jpg'
             
-            # 上传到OSS
+            # 上传到OSS（设置正确的Content-Type，WebP/AVIF才能被浏览器直接显示）
+            headers = {'Content-Type': IMAGE_CONTENT_TYPES[os.path.splitext(filename)[1].lower()]}
+            if cache_control:
+                headers['Cache-Control'] = cache_control
             with open(file_path, 'rb') as file:
-                result = self.bucket.put_object(filename, file)
+                result = self.bucket.put_object(filename, file, headers=headers)
             
             if result.status == 200:
                 # 返回CDN URL
@@ -155,42 +229,38 @@ class CDNService:
         else:
             return f"/static/images/{filename}"
     
-    def batch_upload(self, local_dir, remote_prefix=''):
+    def batch_upload(self, local_dir, remote_prefix='', max_workers=8):
         """
-        批量上传本地图片到CDN
+        批量上传本地图片到CDN（并发上传）
         :param local_dir: 本地目录
         :param remote_prefix: 远程前缀
+        :param max_workers: 最大并发数
         :return: 上传结果
         """
         if not self.is_enabled():
             return {'success': 0, 'failed': 0, 'results': []}
         
-        results = []
-        success_count = 0
-        failed_count = 0
+        filenames = [filename for filename in sorted(os.listdir(local_dir))
+                     if filename.lower().endswith(tuple(IMAGE_CONTENT_TYPES))]
         
-        for filename in os.listdir(local_dir):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-                local_path = os.path.join(local_dir, filename)
-                remote_filename = f"{remote_prefix}{filename}" if remote_prefix else filename
-                
-                cdn_url = self.upload_image(local_path, remote_filename)
-                
-                result = {
-                    'filename': filename,
-                    'cdn_url': cdn_url,
-                    'success': cdn_url is not None
-                }
-                results.append(result)
-                
-                if cdn_url:
-                    success_count += 1
-                else:
-                    failed_count += 1
+        def upload(filename):
+            local_path = os.path.join(local_dir, filename)
+            remote_filename = f"{remote_prefix}{filename}" if remote_prefix else filename
+            return self.upload_image(local_path, remote_filename)
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            cdn_urls = list(executor.map(upload, filenames))
+        
+        results = [{
+            'filename': filename,
+            'cdn_url': cdn_url,
+            'success': cdn_url is not None
+        } for filename, cdn_url in zip(filenames, cdn_urls)]
+        success_count = sum(1 for result in results if result['success'])
         
         return {
             'success': success_count,
-            'failed': failed_count,
+            'failed': len(results) - success_count,
             'results': results
         }
 
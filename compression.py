@@ -0,0 +1,114 @@
+# compression.py
+import gzip
+import os
+import sys
+
+# brotli为可选依赖，未安装时只提供gzip
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+# 需要预压缩的静态文件类型（图片本身已压缩，不再处理）
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.html', '.txt')
+
+# 各编码对应的预压缩文件后缀
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# 小于该大小的内容压缩收益不大
+MIN_COMPRESS_SIZE = 512
+
+
+def supported_encodings():
+    """按优先级返回支持的压缩编码"""
+    return ['br', 'gzip'] if BROTLI_AVAILABLE else ['gzip']
+
+
+def compress(data, encoding):
+    """
+    压缩数据
+    :param data: 原始字节
+    :param encoding: 'br' 或 'gzip'
+    :return: 压缩后的字节
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    if encoding == 'gzip':
+        # mtime=0 保证相同内容得到相同的压缩结果
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    raise ValueError(f"不支持的压缩编码: {encoding}")
+
+
+def negotiate_encoding(accept_encodings):
+    """
+    根据请求的 Accept-Encoding 选择压缩编码
+    :param accept_encodings: request.accept_encodings
+    :return: 编码名称或None（不压缩）
+    """
+    best_encoding = None
+    best_quality = 0
+    for encoding in supported_encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best_encoding = encoding
+            best_quality = quality
+    return best_encoding
+
+
+def precompressed_path(path, encoding):
+    """返回预压缩文件路径，文件不存在或已过期时返回None"""
+    compressed = path + ENCODING_SUFFIXES[encoding]
+    try:
+        if os.path.getmtime(compressed) >= os.path.getmtime(path):
+            return compressed
+    except OSError:
+        pass
+    return None
+
+
+def precompress_file(path):
+    """
+    为单个文件生成各编码的预压缩版本（已是最新的跳过）
+    :return: 新生成的文件数
+    """
+    if os.path.getsize(path) < MIN_COMPRESS_SIZE:
+        return 0
+
+    created = 0
+    data = None
+    for encoding in supported_encodings():
+        if precompressed_path(path, encoding):
+            continue
+        if data is None:
+            with open(path, 'rb') as file:
+                data = file.read()
+        target = path + ENCODING_SUFFIXES[encoding]
+        # 先写临时文件再替换，避免多个进程同时启动时读到半个文件
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(compress(data, encoding))
+        os.replace(tmp_path, target)
+        created += 1
+    return created
+
+
+def precompress_static(static_folder):
+    """
+    预压缩静态目录下的CSS/JS等文本文件
+    :param static_folder: 静态文件目录
+    :return: 新生成的文件数
+    """
+    created = 0
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                created += precompress_file(os.path.join(root, name))
+    return created
+
+
+if __name__ == '__main__':
+    folder = sys.argv[1] if len(sys.argv) > 1 else 'static'
+    count = precompress_static(folder)
+    print(f"✅ 预压缩完成，新生成 {count} 个文件（编码: {', '.join(supported_encodings())}）")
@@ -17,11 +17,16 @@ class Config:
     OSS_ACCESS_KEY_SECRET = os.environ.get('OSS_ACCESS_KEY_SECRET')
     OSS_BUCKET_NAME = os.environ.get('OSS_BUCKET_NAME', 'menu-images')
     OSS_ENDPOINT = os.environ.get('OSS_ENDPOINT', 'oss-cn-hangzhou.aliyuncs.com')
+    # 设置后使用本地目录模拟OSS（离线测试、迁移演练）
+    OSS_LOCAL_DIR = os.environ.get('OSS_LOCAL_DIR')
     
     # CDN配置
     CDN_DOMAIN = os.environ.get('CDN_DOMAIN')
     CLOUDFLARE_DOMAIN = os.environ.get('CLOUDFLARE_DOMAIN')
     
+    # 设置为Nginx internal location的前缀（如 /_static/）后，静态文件交给Nginx通过X-Accel-Redirect发送
+    STATIC_ACCEL_REDIRECT = os.environ.get('STATIC_ACCEL_REDIRECT')
+    
     # 本地备份配置 - Cloudflare方案默认备份到本地
     LOCAL_BACKUP = os.environ.get('LOCAL_BACKUP', 'true').lower() == 'true'
     
@@ -0,0 +1,92 @@
+# database.py
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 每个SQLite连接建立时执行的PRAGMA
+SQLITE_PRAGMAS = (
+    # WAL：写入不阻塞读取，读取也不阻塞写入（数据库级设置，写入文件后永久生效）
+    ('journal_mode', 'WAL'),
+    # WAL模式下NORMAL已能保证数据库不损坏，断电时最多丢失最后一次提交，但每次提交不再fsync
+    ('synchronous', 'NORMAL'),
+    # 遇到写锁时最多等待5秒，而不是立即报 database is locked
+    ('busy_timeout', '5000'),
+    # 每个连接约20MB页缓存（负数表示KB）
+    ('cache_size', '-20000'),
+    # 通过mmap读取数据库文件，减少一次内存拷贝
+    ('mmap_size', str(256 * 1024 * 1024)),
+    # 排序、临时索引放在内存中
+    ('temp_store', 'MEMORY'),
+)
+
+# 设置 SQLITE_TUNING=0 可以关闭以上优化（排查问题、压测对比时使用）
+SQLITE_TUNING = os.environ.get('SQLITE_TUNING', '1') != '0'
+
+
+def is_sqlite(uri):
+    return uri.startswith('sqlite')
+
+
+def is_memory_sqlite(uri):
+    # sqlite:// 和 sqlite:///:memory: 都是内存数据库，也包括 file::memory: 或 mode=memory 形式的URI
+    return uri in ('sqlite://', 'sqlite:///:memory:') or ':memory:' in uri or 'mode=memory' in uri
+
+
+def engine_options(uri):
+    """
+    根据数据库地址生成 SQLALCHEMY_ENGINE_OPTIONS
+    :param uri: 数据库地址
+    :return: 引擎参数
+    """
+    if not is_sqlite(uri):
+        return {'pool_pre_ping': True}
+    if is_memory_sqlite(uri):
+        # 内存数据库由Flask-SQLAlchemy使用单连接的StaticPool，不接受连接池大小参数
+        return {}
+
+    # 每个Gunicorn线程加上后台图片任务线程各占一个连接，连接用完后放回池中复用
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+    return {
+        'pool_size': threads + 2,
+        'max_overflow': threads,
+        'pool_timeout': 10,
+        'connect_args': {
+            # Python层面的锁等待时间，与 busy_timeout 一致
+            'timeout': 5,
+            # 连接由连接池在线程之间传递，同一时间只被一个线程使用
+            'check_same_thread': False,
+        },
+    }
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS:
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def init_database(app):
+    """
+    设置引擎参数并为SQLite连接注册PRAGMA（需在创建 SQLAlchemy(app) 之前调用）
+    :param app: Flask应用
+    """
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(uri))
+    if SQLITE_TUNING and is_sqlite(uri):
+        event.listen(Engine, 'connect', _apply_sqlite_pragmas)
+
+
+def sqlite_settings(connection):
+    """
+    读取当前连接实际生效的设置（用于检查）
+    :param connection: SQLAlchemy连接
+    :return: {PRAGMA名称: 值}
+    """
+    return {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar() for name, _ in SQLITE_PRAGMAS}
@@ -0,0 +1,48 @@
+# gunicorn.conf.py
+# 使用方式：gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+
+# gthread：每个进程多个线程，请求等待磁盘/数据库/慢客户端时不会占住整个进程
+# 进程数与CPU核数相同（至少2个，一个进程重启时另一个继续服务），每个进程4个线程
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS', max(2, multiprocessing.cpu_count())))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# 主进程加载一次应用（静态资源指纹、预压缩只做一次），再fork出工作进程
+preload_app = True
+
+# 静态文件通过 wsgi.file_wrapper 使用 sendfile() 零拷贝发送
+sendfile = True
+
+# Nginx与Gunicorn之间保持长连接
+keepalive = 5
+timeout = 30
+graceful_timeout = 30
+
+# 定期重启工作进程，防止长期运行的内存增长
+# 重启后要重新构建菜单快照，图片请求也计入次数，间隔不宜太短
+max_requests = 20000
+max_requests_jitter = 2000
+
+# 心跳文件放在内存文件系统，避免磁盘繁忙时工作进程被误判超时
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# 访问日志由Nginx记录，需要时设置 GUNICORN_ACCESS_LOG=- 输出到标准输出
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def worker_exit(server, worker):
+    # 在工作进程中执行：退出前写入最后几秒的指标数据
+    from metrics import request_metrics
+    request_metrics.flush()
+
+
+def child_exit(server, worker):
+    # 在主进程中执行：把已退出工作进程的指标合并到 retired.json，并删除它的指标文件
+    from metrics import request_metrics
+    request_metrics.retire_process(worker.pid)
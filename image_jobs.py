@@ -0,0 +1,159 @@
+# image_jobs.py
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class ImageJobQueue:
+    """
+    基于数据库的图片处理任务队列
+    上传请求只负责保存原始文件并写入任务记录，后台线程负责生成多分辨率版本和上传CDN。
+    任务记录保存在SQLite中，多个Gunicorn进程通过条件UPDATE抢占任务，进程重启后未完成的任务会继续执行。
+    """
+
+    def __init__(self, max_attempts=3, retry_delay=10, poll_interval=5, stale_after=600):
+        """
+        :param max_attempts: 最大尝试次数
+        :param retry_delay: 首次重试等待秒数（之后按2的幂递增）
+        :param poll_interval: 空闲时轮询数据库的间隔秒数
+        :param stale_after: 处理中超过该秒数的任务视为进程已退出，重新排队
+        """
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.app = None
+        self.db = None
+        self.model = None
+        self.handler = None
+        self.permanent_errors = ()
+        self.on_failure = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def init_app(self, app, db, model, handler, permanent_errors=(), on_failure=None):
+        """
+        :param app: Flask应用
+        :param db: SQLAlchemy实例
+        :param model: 任务模型（需要 status/attempts/error/next_run_at/updated_at 字段）
+        :param handler: 处理函数，参数为任务对象，抛出异常表示失败
+        :param permanent_errors: 重试也不会成功的异常类型，抛出时任务直接失败
+        :param on_failure: 任务最终失败时调用，参数为任务对象（用于清理任务的文件）
+        """
+        self.app = app
+        self.db = db
+        self.model = model
+        self.handler = handler
+        self.permanent_errors = tuple(permanent_errors)
+        self.on_failure = on_failure
+
+    def enqueue(self, **fields):
+        """
+        新建任务（在调用方的事务中，提交后再调用 notify()）
+        :return: 任务对象
+        """
+        now = datetime.utcnow()
+        job = self.model(status='pending', attempts=0, next_run_at=now, created_at=now, updated_at=now, **fields)
+        self.db.session.add(job)
+        return job
+
+    def notify(self):
+        """唤醒后台线程立即处理新任务"""
+        self.ensure_started()
+        self._wakeup.set()
+
+    def ensure_started(self):
+        """启动后台线程（每个进程一个）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='image-job-worker', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self._requeue_stale()
+                    while self._process_next():
+                        pass
+            except Exception as e:
+                print(f"❌ 图片任务线程异常: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _requeue_stale(self):
+        """把长时间停留在处理中的任务重新排队"""
+        model = self.model
+        deadline = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        model.query.filter(model.status == 'processing', model.updated_at < deadline).update(
+            {'status': 'pending', 'updated_at': datetime.utcnow()}, synchronize_session=False)
+        self.db.session.commit()
+
+    def _due_jobs(self, now, limit=5):
+        """
+        到期的待处理任务，最早到期的在前（与 (status, next_run_at) 索引顺序一致，不需要额外排序）
+        :param now: 当前时间
+        :param limit: 最多返回的数量
+        :return: 任务对象列表
+        """
+        model = self.model
+        return (model.query
+                .filter(model.status == 'pending', model.next_run_at <= now)
+                .order_by(model.next_run_at, model.id)
+                .limit(limit)
+                .all())
+
+    def _claim(self):
+        """抢占一个到期的任务，返回任务对象或None"""
+        model = self.model
+        now = datetime.utcnow()
+        for job in self._due_jobs(now):
+            # 条件更新保证同一任务只会被一个进程拿到
+            claimed = model.query.filter(model.id == job.id, model.status == 'pending').update(
+                {'status': 'processing', 'attempts': model.attempts + 1, 'updated_at': now},
+                synchronize_session=False)
+            self.db.session.commit()
+            if claimed:
+                return self.db.session.get(model, job.id)
+        return None
+
+    def _process_next(self):
+        """处理一个任务，没有可处理的任务时返回False"""
+        job = self._claim()
+        if job is None:
+            return False
+
+        started = time.time()
+        try:
+            self.handler(job)
+            job.status = 'done'
+            job.error = None
+            print(f"✅ 图片任务 {job.id} 完成，耗时 {time.time() - started:.2f}s")
+        except Exception as e:
+            self.db.session.rollback()
+            job = self.db.session.get(self.model, job.id)
+            job.error = str(e)[:500]
+            if job.attempts >= self.max_attempts or isinstance(e, self.permanent_errors):
+                job.status = 'failed'
+                print(f"❌ 图片任务 {job.id} 失败: {e}")
+                if self.on_failure is not None:
+                    try:
+                        self.on_failure(job)
+                    except Exception as cleanup_error:
+                        print(f"⚠️  图片任务 {job.id} 清理失败: {cleanup_error}")
+            else:
+                job.status = 'pending'
+                job.next_run_at = datetime.utcnow() + timedelta(
+                    seconds=self.retry_delay * 2 ** (job.attempts - 1))
+                print(f"⚠️  图片任务 {job.id} 第 {job.attempts} 次失败，稍后重试: {e}")
+        job.updated_at = datetime.utcnow()
+        self.db.session.commit()
+        return True
+
+
+# 创建全局图片任务队列实例
+image_job_queue = ImageJobQueue()
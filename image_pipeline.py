@@ -0,0 +1,171 @@
+# image_pipeline.py
+import hashlib
+import mimetypes
+import os
+import re
+from PIL import Image, features
+
+# 较旧的Python版本不认识这些扩展名
+mimetypes.add_type('image/webp', '.webp')
+mimetypes.add_type('image/avif', '.avif')
+
+# 菜品图片的多分辨率宽度：
+# 手机卡片图片约70-90px（1x/2x/3x ≈ 180/350），桌面卡片约350px（1x/2x/3x ≈ 350/700/1050）
+VARIANT_WIDTHS = (180, 350, 700, 1050)
+
+# 作为 <img src> 回退及 Dish.image 的默认宽度
+DEFAULT_WIDTH = 350
+
+# 浏览器据此从 srcset 中挑选合适的图片，与 style.css 中卡片图片的显示宽度对应
+IMAGE_SIZES = '(max-width: 480px) 70px, (max-width: 768px) 90px, 400px'
+
+# 现代图片格式，按优先级排列：格式名 -> (Pillow格式, 扩展名, MIME类型, 质量)
+# JPEG始终生成，作为不支持这些格式的浏览器的回退
+MODERN_FORMATS = {
+    'avif': ('AVIF', '.avif', 'image/avif', 50),
+    'webp': ('WEBP', '.webp', 'image/webp', 72),
+}
+
+JPEG_FORMAT = 'jpeg'
+
+# 按内容哈希命名的图片：<哈希前32位>_w<宽度>.<扩展名>，内容永不改变，可以长期缓存
+CONTENT_HASH_LENGTH = 32
+CONTENT_ADDRESSED_PATTERN = re.compile(r'(^|/)[0-9a-f]{%d}_w\d+\.(jpg|webp|avif)$' % CONTENT_HASH_LENGTH)
+
+
+def file_sha256(path):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_valid_image(path):
+    """检查文件是否为Pillow可以识别的完整图片（只读取文件头和校验结构，不解码像素）"""
+    try:
+        with Image.open(path) as img:
+            img.verify()
+        return True
+    except Exception:
+        return False
+
+
+def content_base_name(sha256):
+    """按内容哈希生成的图片文件名前缀"""
+    return sha256[:CONTENT_HASH_LENGTH]
+
+
+def is_content_addressed(filename):
+    """判断文件名是否为按内容哈希命名的图片"""
+    return bool(CONTENT_ADDRESSED_PATTERN.search(filename))
+
+
+def available_formats():
+    """返回当前Pillow支持编码的现代格式"""
+    return [name for name in MODERN_FORMATS if features.check(name)]
+
+
+def to_rgb(img):
+    """转换为RGB模式（透明背景填充为白色）"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def variant_widths(original_width, widths=VARIANT_WIDTHS):
+    """
+    计算需要生成的宽度（不放大原图）
+    :param original_width: 原图宽度
+    :param widths: 目标宽度
+    :return: 升序且去重的宽度列表
+    """
+    return sorted({min(width, original_width) for width in widths})
+
+
+def _save_variant(img, output_dir, base_name, width, fmt, quality):
+    """按指定格式保存单个版本，返回文件名"""
+    if fmt == JPEG_FORMAT:
+        filename = f"{base_name}_w{width}.jpg"
+        img.save(os.path.join(output_dir, filename), 'JPEG', quality=quality,
+                 optimize=True, progressive=True)
+    else:
+        pil_format, extension, _, fmt_quality = MODERN_FORMATS[fmt]
+        filename = f"{base_name}_w{width}{extension}"
+        img.save(os.path.join(output_dir, filename), pil_format, quality=fmt_quality)
+    return filename
+
+
+def generate_variants(source_path, output_dir, base_name, widths=VARIANT_WIDTHS, quality=75, formats=None):
+    """
+    为上传的图片生成多分辨率版本：每个宽度一张JPEG，外加WebP/AVIF等现代格式
+    :param source_path: 原始图片路径
+    :param output_dir: 输出目录
+    :param base_name: 输出文件名前缀（不含扩展名）
+    :param widths: 目标宽度
+    :param quality: JPEG质量
+    :param formats: 额外生成的现代格式，默认为当前支持的全部格式
+    :return: [{'width': 宽度, 'format': 格式, 'filename': 文件名}]，按宽度升序
+    """
+    if formats is None:
+        formats = available_formats()
+    
+    variants = []
+    with Image.open(source_path) as img:
+        img = to_rgb(img)
+        for width in variant_widths(img.width, widths):
+            if width < img.width:
+                height = int(img.height * width / img.width)
+                resized = img.resize((width, height), Image.Resampling.LANCZOS)
+            else:
+                resized = img
+            for fmt in [JPEG_FORMAT] + list(formats):
+                filename = _save_variant(resized, output_dir, base_name, width, fmt, quality)
+                variants.append({'width': width, 'format': fmt, 'filename': filename})
+    return variants
+
+
+def variants_of_format(variants, fmt=JPEG_FORMAT):
+    """筛选某一格式的版本（旧数据没有format字段，视为JPEG）"""
+    return [variant for variant in variants if variant.get('format', JPEG_FORMAT) == fmt]
+
+
+def default_variant(variants, width=DEFAULT_WIDTH):
+    """选择不小于默认宽度的最小JPEG版本，没有则取最大的"""
+    variants = variants_of_format(variants)
+    for variant in variants:
+        if variant['width'] >= width:
+            return variant
+    return variants[-1] if variants else None
+
+
+def build_srcset(variants, src_of):
+    """
+    生成 srcset 属性值
+    :param variants: 版本列表
+    :param src_of: 函数，返回某个版本的图片URL
+    :return: 如 "/static/images/a_w180.jpg 180w, ..."
+    """
+    return ', '.join(f"{src_of(variant)} {variant['width']}w" for variant in variants)
+
+
+def build_sources(variants, src_of):
+    """
+    生成 <picture> 中各现代格式的 <source> 数据
+    :param variants: 版本列表
+    :param src_of: 函数，返回某个版本的图片URL
+    :return: [{'type': MIME类型, 'srcset': ...}]，按格式优先级排列
+    """
+    sources = []
+    for fmt, (_, _, mime_type, _) in MODERN_FORMATS.items():
+        fmt_variants = variants_of_format(variants, fmt)
+        if fmt_variants:
+            sources.append({'type': mime_type, 'srcset': build_srcset(fmt_variants, src_of)})
+    return sources
@@ -0,0 +1,142 @@
+# menu_cache.py
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+from compression import compress
+
+
+def dump_json_bytes(data):
+    """把数据序列化为紧凑的UTF-8 JSON字节"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def content_etag(data):
+    """根据内容计算强ETag"""
+    return hashlib.sha1(data).hexdigest()
+
+
+class MenuSnapshot:
+    """某一菜单版本的只读快照，保存预序列化好的JSON字节及其ETag"""
+
+    def __init__(self, version, payloads, last_modified):
+        self.version = version
+        self.built_at = time.time()
+        self.last_modified = last_modified
+        self.payloads = payloads
+        self.etags = {name: content_etag(data) for name, data in payloads.items()}
+        self.pages = {}
+        self.encoded = {}
+
+    def compressed(self, key, data, encoding):
+        """
+        获取内容的压缩版本，同一快照内每种编码只压缩一次
+        :param key: 内容的缓存键
+        :param data: 原始字节
+        :param encoding: 压缩编码
+        :return: 压缩后的字节
+        """
+        cache_key = (key, encoding)
+        encoded = self.encoded.get(cache_key)
+        if encoded is None:
+            encoded = compress(data, encoding)
+            self.encoded[cache_key] = encoded
+        return encoded
+
+    def rendered(self, key, render):
+        """
+        获取基于本快照渲染的页面，每个key只渲染一次
+        :param key: 缓存键（如语言）
+        :param render: 无参渲染函数，返回HTML字符串
+        :return: (HTML字节, ETag)
+        """
+        page = self.pages.get(key)
+        if page is None:
+            html = render().encode('utf-8')
+            page = (html, content_etag(html))
+            self.pages[key] = page
+        return page
+
+
+class MenuCache:
+    """
+    进程内菜单快照缓存
+    读接口直接返回快照中的JSON字节，不做任何ORM查询；
+    后台每次写操作提交后调用 invalidate() 递增版本号，下次读取时重建快照。
+    设置了版本读取函数时，版本号保存在数据库中（所有工作进程、所有服务器共用），
+    每次读取都查询一次版本号（主键查询），发现变化后只重建一次快照：
+    后台保存后立即重新读取菜单时，即使请求落到另一个进程也能看到刚才的修改
+    """
+
+    def __init__(self, builder=None, version_reader=None):
+        self._builder = builder
+        self._version_reader = version_reader
+        self._version = 0
+        self._changed_at = datetime.now(timezone.utc)
+        self._snapshot = None
+        self._version_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def init_builder(self, builder, version_reader=None):
+        """
+        设置快照构建函数
+        :param builder: 无参函数，返回 {名称: 可JSON序列化的数据}
+        :param version_reader: 无参函数，返回数据库中的 (版本号, 修改时间)，为空时只使用进程内版本号
+        """
+        self._builder = builder
+        self._version_reader = version_reader
+
+    @property
+    def version(self):
+        return self._version
+
+    def invalidate(self):
+        """菜单数据已变更：本进程的写操作提交后调用（数据库版本号已随写操作一起提交，只需更新进程内版本号）"""
+        if self._version_reader is not None:
+            return
+        with self._version_lock:
+            self._version += 1
+            self._changed_at = datetime.now(timezone.utc)
+
+    def _current_version(self):
+        """
+        读取当前版本号
+        :return: (版本号, 修改时间)
+        """
+        if self._version_reader is None:
+            with self._version_lock:
+                return self._version, self._changed_at
+        version, changed_at = self._version_reader()
+        with self._version_lock:
+            self._version = version
+            if changed_at is not None:
+                self._changed_at = changed_at
+            return version, self._changed_at
+
+    def get(self):
+        """
+        获取当前版本的快照，版本过期时重建
+        :return: MenuSnapshot
+        """
+        version, changed_at = self._current_version()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        # 同一时刻只允许一个线程重建，其余线程等待后直接复用结果
+        with self._build_lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.version == version:
+                return snapshot
+
+            data = self._builder()
+            payloads = {name: dump_json_bytes(value) for name, value in data.items()}
+            snapshot = MenuSnapshot(version, payloads, changed_at)
+            self._snapshot = snapshot
+            return snapshot
+
+
+# 创建全局菜单缓存实例
+menu_cache = MenuCache()
@@ -0,0 +1,260 @@
+# metrics.py
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 请求耗时分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# 响应大小分桶（字节）
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# 每个请求的SQL查询次数分桶
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50)
+
+# 图片处理耗时分桶（秒）
+IMAGE_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 指标说明：名称 -> (类型, 分桶, 说明)
+METRICS = {
+    'menu_http_requests_total': ('counter', None, '请求次数'),
+    'menu_http_request_duration_seconds': ('histogram', LATENCY_BUCKETS, '请求处理耗时'),
+    'menu_http_response_size_bytes': ('histogram', SIZE_BUCKETS, '响应体大小'),
+    'menu_db_queries_per_request': ('histogram', QUERY_COUNT_BUCKETS, '每个请求的SQL查询次数'),
+    'menu_db_query_seconds_total': ('counter', None, 'SQL查询累计耗时'),
+    'menu_image_processing_seconds': ('histogram', IMAGE_BUCKETS, '后台图片处理耗时'),
+}
+
+# 各进程写入指标文件的最小间隔（秒）
+FLUSH_INTERVAL = 5
+
+# 已退出的工作进程的数据合并到这个文件中（Gunicorn的 max_requests 会定期重启工作进程）
+RETIRED_FILENAME = 'retired.json'
+
+
+def _format_labels(labels, extra=''):
+    text = ','.join([f'{name}="{value}"' for name, value in labels] + ([extra] if extra else []))
+    return f'{{{text}}}' if text else ''
+
+
+def _format_value(value):
+    # 计数按整数输出，耗时等浮点数保留全部精度（:g 只保留6位有效数字，累计值变大后 rate() 会出错）
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class RequestMetrics:
+    """
+    轻量级请求性能指标
+    记录每个路由的耗时分布、SQL查询次数和耗时、响应大小以及后台图片处理耗时，
+    以Prometheus文本格式从 /metrics 输出，并在每个响应中加上 Server-Timing 头。
+    Gunicorn的每个工作进程定期把自己的数据写到指标目录，/metrics 汇总所有进程的数据。
+    工作进程退出后，主进程把它的数据合并到 retired.json 并删除它的文件，目录中的文件数不随重启次数增加。
+    """
+
+    def __init__(self):
+        self.storage_dir = None
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def init_app(self, app):
+        """注册请求钩子和SQL事件"""
+        self.storage_dir = os.path.join(app.instance_path, 'metrics')
+        os.makedirs(self.storage_dir, exist_ok=True)
+
+        # 放在最前面，计时包含其他before_request钩子
+        app.before_request_funcs.setdefault(None, []).insert(0, self._start_request)
+        app.after_request(self._finish_request)
+
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def reset_storage(self):
+        """清空指标目录（服务启动、fork工作进程之前调用）"""
+        for path in glob.glob(os.path.join(self.storage_dir, '*.json')):
+            os.remove(path)
+
+    # ---- 采集 ----
+
+    def observe(self, name, value, **labels):
+        """记录一次直方图观测值"""
+        key = (name, tuple(sorted(labels.items())))
+        buckets = METRICS[name][1]
+        with self._lock:
+            values = self._histograms.get(key)
+            if values is None:
+                # 各分桶计数 + 总和 + 次数
+                values = [0] * (len(buckets) + 1) + [0.0, 0]
+                self._histograms[key] = values
+            values[bisect.bisect_left(buckets, value)] += 1
+            values[-2] += value
+            values[-1] += 1
+        self._maybe_flush()
+
+    def increment(self, name, value=1, **labels):
+        """计数器累加"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            conn.info.setdefault('metrics_query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('metrics_query_started')
+        if started and has_request_context():
+            elapsed = time.perf_counter() - started.pop()
+            g.metrics_query_count = g.get('metrics_query_count', 0) + 1
+            g.metrics_query_time = g.get('metrics_query_time', 0.0) + elapsed
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        query_count = g.get('metrics_query_count', 0)
+        query_time = g.get('metrics_query_time', 0.0)
+        endpoint = request.endpoint or 'unknown'
+
+        self.increment('menu_http_requests_total', endpoint=endpoint, method=request.method,
+                       status=str(response.status_code))
+        self.increment('menu_db_query_seconds_total', query_time, endpoint=endpoint)
+        self.observe('menu_db_queries_per_request', query_count, endpoint=endpoint)
+        if response.content_length is not None:
+            self.observe('menu_http_response_size_bytes', response.content_length, endpoint=endpoint)
+        self.observe('menu_http_request_duration_seconds', elapsed, endpoint=endpoint, method=request.method)
+
+        response.headers.add('Server-Timing', f'app;dur={elapsed * 1000:.1f}')
+        response.headers.add('Server-Timing', f'db;dur={query_time * 1000:.1f};desc="{query_count} queries"')
+        return response
+
+    # ---- 多进程汇总 ----
+
+    def _snapshot(self):
+        with self._lock:
+            return {
+                'histograms': [[name, labels, list(values)] for (name, labels), values in self._histograms.items()],
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+            }
+
+    def _maybe_flush(self):
+        now = time.time()
+        if self.storage_dir is None or now - self._last_flush < FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+        self.flush()
+
+    def flush(self):
+        """把本进程的数据写入指标目录"""
+        if self.storage_dir is None:
+            return
+        self._write(os.path.join(self.storage_dir, f'{os.getpid()}.json'), self._snapshot())
+
+    @staticmethod
+    def _write(path, data):
+        tmp_path = f'{path}.tmp'
+        try:
+            with open(tmp_path, 'w') as file:
+                json.dump(data, file)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️  指标写入失败: {e}")
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _merge(data, histograms, counters):
+        for name, labels, values in data['histograms']:
+            key = (name, tuple(tuple(label) for label in labels))
+            merged = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                merged[i] += value
+        for name, labels, value in data['counters']:
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+
+    def retire_process(self, pid):
+        """
+        工作进程已退出（由Gunicorn主进程的 child_exit 钩子调用）：把它的数据合并到 retired.json 并删除它的文件
+        不能直接丢弃：汇总的计数器变小时，Prometheus会当作计数器重置，rate() 会出现尖峰
+        :param pid: 已退出的进程ID
+        """
+        if self.storage_dir is None:
+            return
+        path = os.path.join(self.storage_dir, f'{pid}.json')
+        data = self._read(path)
+        if data is not None:
+            retired_path = os.path.join(self.storage_dir, RETIRED_FILENAME)
+            histograms = {}
+            counters = {}
+            for part in (self._read(retired_path), data):
+                if part is not None:
+                    self._merge(part, histograms, counters)
+            self._write(retired_path, {
+                'histograms': [[name, labels, values] for (name, labels), values in histograms.items()],
+                'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            })
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _collect(self):
+        """汇总所有进程的数据（本进程用内存中的最新数据）"""
+        self.flush()
+        histograms = {}
+        counters = {}
+        for path in glob.glob(os.path.join(self.storage_dir, '*.json')):
+            data = self._read(path)
+            if data is not None:
+                self._merge(data, histograms, counters)
+        return histograms, counters
+
+    def render(self):
+        """
+        生成Prometheus文本格式的指标
+        :return: 文本
+        """
+        histograms, counters = self._collect()
+        lines = []
+        for name, (metric_type, buckets, description) in METRICS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            if metric_type == 'counter':
+                for (key_name, labels), value in sorted(counters.items()):
+                    if key_name == name:
+                        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+            for (key_name, labels), values in sorted(histograms.items()):
+                if key_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], values[:-2]):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f'{name}_bucket{_format_labels(labels, le)} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(values[-2])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {_format_value(values[-1])}')
+        return '\n'.join(lines) + '\n'
+
+
+# 创建全局指标实例
+request_metrics = RequestMetrics()
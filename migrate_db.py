@@ -1,21 +1,160 @@
 #!/usr/bin/env python3
 """
 数据库迁移脚本
-用于添加CDN相关字段到现有数据库
+用于添加CDN相关字段及查询索引到现有数据库
 """
 
 import os
+import re
 import sys
+from datetime import datetime
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app import app, db
+from app import (app, db, Category, create_dish_search_index, dish_search_index_ready, generate_dish_number,
+                 image_job_queue, query_dishes_with_allergen, query_menu_categories, query_menu_dishes,
+                 read_menu_version, reorder_dishes_in_category)
+from search_index import rebuild_search_index
+
+def find_duplicates(conn, table, columns):
+    """查找违反唯一索引的重复值"""
+    column_list = ', '.join(columns)
+    return conn.execute(db.text(
+        f'SELECT {column_list}, COUNT(*) FROM {table} GROUP BY {column_list} HAVING COUNT(*) > 1'
+    )).fetchall()
+
+def create_missing_indexes():
+    """
+    按模型中的定义创建缺少的索引，并更新查询规划器的统计信息
+    :return: 新建的索引数
+    """
+    inspector = db.inspect(db.engine)
+    created = 0
+    with db.engine.connect() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if index.name in existing:
+                    continue
+                columns = [column.name for column in index.columns]
+                if index.unique:
+                    duplicates = find_duplicates(conn, table.name, columns)
+                    if duplicates:
+                        print(f"⚠️  {table.name}.{', '.join(columns)} 存在重复值，跳过唯一索引 {index.name}: {duplicates}")
+                        print("   请在后台修改重复的数据后重新运行迁移")
+                        continue
+                print(f"📝 创建索引 {index.name} ON {table.name} ({', '.join(columns)})...")
+                index.create(bind=conn)
+                created += 1
+        conn.execute(db.text('ANALYZE'))
+        conn.commit()
+    return created
+
+def hot_queries():
+    """
+    菜单读写路径上的主要操作：(名称, 执行函数, 期望使用的索引, 本来就要完整读取、允许扫描的表)
+    检查时实际调用应用中的函数，查看它们发出的每一条SQL语句的查询计划
+    """
+    return [
+        # 完整菜单本来就要读取全部分类、过敏源和菜品过敏源关联：按排序号索引依次读取分类，菜品和分量按分类/菜品ID查找
+        # （有统计信息时，规划器会直接读取整个过敏源关联表和过敏源表，而不是按ID逐个查找）
+        ('菜单菜品（按分类、排序号）', query_menu_dishes,
+         ('ix_category_sort_order', 'ix_dish_category_sort', 'ix_dish_portion_dish_sort'),
+         ('category', 'dish_allergen', 'allergen')),
+        ('分类列表', query_menu_categories, ('ix_category_sort_order',), ('category',)),
+        ('菜单版本号', read_menu_version, ('INTEGER PRIMARY KEY',), ()),
+        # 生成菜品序号只按主键读写分类的序号计数器
+        ('生成菜品序号', lambda: generate_dish_number(1), ('INTEGER PRIMARY KEY',), ()),
+        ('分类重新编号', lambda: reorder_dishes_in_category(1), ('ix_dish_category_sort',), ()),
+        ('前缀字母查重', lambda: Category.query.filter_by(prefix_letter='A').first(),
+         ('uq_category_prefix_letter',), ()),
+        ('按过敏源查菜品', lambda: query_dishes_with_allergen(1), ('ix_dish_allergen_allergen_id',), ()),
+        ('抢占图片任务', lambda: image_job_queue._due_jobs(datetime.utcnow()), ('ix_image_job_status_next_run',), ()),
+    ]
+
+def collect_query_plans(run):
+    """
+    调用函数，记录它发出的SQL语句，并在同一个连接上（临时表也可见）读取每条语句的查询计划，最后回滚
+    :param run: 无参函数
+    :return: [(SQL语句, [计划步骤])]
+    """
+    statements = []
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'INSERT', 'UPDATE', 'DELETE')):
+            statements.append((statement, parameters))
+    
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        run()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    try:
+        connection = db.session.connection()
+        return [(statement, [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)])
+                for statement, parameters in statements]
+    finally:
+        # 检查不能修改数据（如重新编号）
+        db.session.rollback()
+
+def plan_problems(plans, index_names, full_scans=()):
+    """
+    检查查询计划：期望的索引必须用于查找（SEARCH），不能有全表扫描和临时排序
+    :param plans: collect_query_plans 的结果
+    :param index_names: 期望使用的索引（'INTEGER PRIMARY KEY' 表示按主键查找）
+    :param full_scans: 本来就要完整读取、允许扫描的表（按索引顺序扫描时也算使用了该索引）
+    :return: 问题描述列表，没有问题时为空
+    """
+    problems = []
+    used = []
+    for statement, plan in plans:
+        for step in plan:
+            words = step.split()
+            if 'TEMP B-TREE' in step:
+                problems.append(f"临时排序: {step}")
+            elif words[0] == 'SCAN' and not words[1].startswith('('):
+                # 子查询的结果（SCAN (subquery-1)）不是表
+                if words[1] in full_scans:
+                    used.append(step)
+                else:
+                    problems.append(f"全表扫描: {step}")
+            elif words[0] == 'SEARCH':
+                used.append(step)
+    for index_name in index_names:
+        pattern = re.compile(rf'USING {index_name}\b' if index_name == 'INTEGER PRIMARY KEY'
+                             else rf'USING (COVERING )?INDEX {index_name}\b')
+        if not any(pattern.search(step) for step in used):
+            problems.append(f"没有使用 {index_name}")
+    return problems
+
+def explain_queries():
+    """用 EXPLAIN QUERY PLAN 检查主要查询是否使用了索引"""
+    print("🔍 检查查询计划...")
+    all_ok = True
+    with app.app_context():
+        for name, run, index_names, full_scans in hot_queries():
+            plans = collect_query_plans(run)
+            problems = plan_problems(plans, index_names, full_scans)
+            all_ok = all_ok and not problems
+            print(f"{'✅' if not problems else '❌'} {name}（期望使用 {', '.join(index_names)}）")
+            for problem in problems:
+                print(f"     ⚠️  {problem}")
+            for statement, plan in plans:
+                print(f"     {' '.join(statement.split())[:100]}")
+                for step in plan:
+                    print(f"       {step}")
+    if all_ok:
+        print("✅ 所有主要查询都使用了索引")
+    else:
+        print("❌ 部分查询没有使用索引，请先运行: python migrate_db.py migrate")
+    return all_ok
 
 def migrate_database():
-    """迁移数据库，添加CDN字段和纯素字段"""
+    """迁移数据库，添加CDN字段、纯素字段和多分辨率图片字段"""
     print("🔄 开始数据库迁移...")
     
     with app.app_context():
@@ -43,6 +182,72 @@ def migrate_database():
             else:
                 print("ℹ️  is_vegan 字段已存在")
             
+            if 'image_variants' not in column_names:
+                print("📝 添加 image_variants 字段...")
+                with db.engine.connect() as conn:
+                    conn.execute(db.text('ALTER TABLE dish ADD COLUMN image_variants TEXT'))
+                    conn.commit()
+                print("✅ image_variants 字段添加成功")
+            else:
+                print("ℹ️  image_variants 字段已存在")
+            
+            if 'image_hash' not in column_names:
+                print("📝 添加 image_hash 字段...")
+                with db.engine.connect() as conn:
+                    conn.execute(db.text('ALTER TABLE dish ADD COLUMN image_hash VARCHAR(64)'))
+                    conn.execute(db.text('CREATE INDEX IF NOT EXISTS ix_dish_image_hash ON dish (image_hash)'))
+                    conn.commit()
+                print("✅ image_hash 字段添加成功")
+            else:
+                print("ℹ️  image_hash 字段已存在")
+            
+            category_columns = [col['name'] for col in inspector.get_columns('category')]
+            if 'next_dish_number' not in category_columns:
+                print("📝 添加 next_dish_number 字段...")
+                with db.engine.connect() as conn:
+                    conn.execute(db.text(
+                        'ALTER TABLE category ADD COLUMN next_dish_number INTEGER NOT NULL DEFAULT 1'))
+                    # 从现有菜品序号中取出最大值，计数器从下一个号码开始
+                    conn.execute(db.text("""
+                        UPDATE category SET next_dish_number = 1 + COALESCE((
+                            SELECT MAX(CAST(SUBSTR(dish.dish_number, 2) AS INTEGER))
+                            FROM dish
+                            WHERE dish.category_id = category.id
+                              AND SUBSTR(dish.dish_number, 1, 1) = category.prefix_letter
+                        ), 0)
+                    """))
+                    conn.commit()
+                print("✅ next_dish_number 字段添加成功")
+            else:
+                print("ℹ️  next_dish_number 字段已存在")
+            
+            # 增量同步使用的修改版本号，已有数据视为版本0（客户端第一次同步前已有的数据）
+            for table in ('dish', 'category', 'allergen'):
+                table_columns = [col['name'] for col in inspector.get_columns(table)]
+                if 'version' not in table_columns:
+                    print(f"📝 添加 {table}.version 字段...")
+                    with db.engine.connect() as conn:
+                        conn.execute(db.text(f'ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0'))
+                        conn.commit()
+                    print(f"✅ {table}.version 字段添加成功")
+                else:
+                    print(f"ℹ️  {table}.version 字段已存在")
+            
+            # 创建新增的表（如图片处理任务表 image_job、菜单版本表 menu_version、删除记录表 menu_tombstone），已存在的表不受影响
+            db.create_all()
+            print("✅ 新增数据表检查完成")
+            
+            # 为已有的表补充查询索引
+            created = create_missing_indexes()
+            print(f"✅ 索引检查完成，新建 {created} 个索引")
+            
+            # 菜品全文搜索表 dish_fts，新建时写入已有菜品；之后由 app.py 的 sync_dish_search_index 同步（不要再加触发器，否则会重复索引）
+            indexed = create_dish_search_index()
+            if indexed is not None:
+                print(f"✅ 菜品搜索索引创建成功，写入 {indexed} 道菜品")
+            else:
+                print("ℹ️  菜品搜索索引已存在或不可用")
+            
             print("✅ 数据库迁移完成")
             
         except Exception as e:
@@ -51,6 +256,18 @@ def migrate_database():
     
     return True
 
+def reindex_search():
+    """重建菜品搜索索引（不是通过后台修改的菜品，如用sqlite3命令行修改后运行）"""
+    with app.app_context():
+        created = create_dish_search_index()
+        with db.engine.begin() as conn:
+            if not dish_search_index_ready(conn):
+                print("❌ 菜品搜索索引不可用（数据库不是SQLite或不支持FTS5）")
+                return False
+            count = created if created is not None else rebuild_search_index(conn)
+    print(f"✅ 菜品搜索索引已重建，写入 {count} 道菜品")
+    return True
+
 def rollback_migration():
     """回滚迁移"""
     print("🔄 开始回滚数据库迁移...")
@@ -109,19 +326,26 @@ def main():
         print("  python migrate_db.py migrate    # 执行迁移")
         print("  python migrate_db.py rollback   # 回滚迁移")
         print("  python migrate_db.py status     # 检查状态")
+        print("  python migrate_db.py explain    # 检查主要查询是否使用索引")
+        print("  python migrate_db.py reindex    # 重建菜品搜索索引")
         return
     
     command = sys.argv[1].lower()
     
     if command == 'migrate':
-        migrate_database()
+        # 更新脚本根据退出码决定是否启动服务
+        sys.exit(0 if migrate_database() else 1)
     elif command == 'rollback':
         rollback_migration()
     elif command == 'status':
         check_migration_status()
+    elif command == 'explain':
+        sys.exit(0 if explain_queries() else 1)
+    elif command == 'reindex':
+        reindex_search()
     else:
         print(f"❌ 未知命令: {command}")
-        print("可用命令: migrate, rollback, status")
+        print("可用命令: migrate, rollback, status, explain, reindex")
 
 if __name__ == '__main__':
     main()
@@ -5,17 +5,156 @@
 
 import os
 import sys
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app import app, db, Dish
+from app import app, db, Dish, IMMUTABLE_CACHE_CONTROL, remove_dish_image_files
 from cdn_service import cdn_service
+from config import Config
+from image_pipeline import default_variant, file_sha256
 
-def migrate_existing_images():
-    """迁移现有图片到CDN"""
+# 迁移清单：记录已上传对象的内容哈希，重复运行时跳过未变化的文件
+MANIFEST_FILENAME = 'cdn_migration_manifest.json'
+
+
+class MigrationManifest:
+    """线程安全的迁移清单（对象名 -> 内容哈希和CDN URL）"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.objects = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    self.objects = json.load(file).get('objects', {})
+            except (OSError, ValueError) as e:
+                print(f"⚠️  迁移清单读取失败，将重新上传: {e}")
+    
+    def lookup(self, key, sha256, cache_control=None):
+        """内容和缓存头都相同的对象已上传过时返回其CDN URL（早期未设置缓存头上传的版本会重新上传）"""
+        with self.lock:
+            entry = self.objects.get(key)
+        if entry and entry.get('sha256') == sha256 and entry.get('cache_control') == cache_control:
+            return entry.get('cdn_url')
+        return None
+    
+    def record(self, key, sha256, cdn_url, cache_control=None):
+        with self.lock:
+            self.objects[key] = {'sha256': sha256, 'cdn_url': cdn_url, 'cache_control': cache_control}
+    
+    def save(self):
+        with self.lock:
+            data = json.dumps({'objects': self.objects}, ensure_ascii=False, indent=1)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(data)
+        os.replace(tmp_path, self.path)
+
+
+def plan_dish_uploads(dish):
+    """
+    列出菜品需要上传的文件
+    :return: [(对象名, 本地路径, 是否需要先优化)]
+    有多分辨率版本的菜品直接上传各个版本；旧数据只有一张原图，按原方式优化后上传
+    """
+    variants = json.loads(dish.image_variants) if dish.image_variants else []
+    if variants:
+        return [(os.path.basename(v['path']), os.path.join('static', v['path']), False)
+                for v in variants if v.get('path')]
+    return [(os.path.basename(dish.image), os.path.join('static', dish.image), True)]
+
+
+def upload_dish_files(uploads, manifest, stats):
+    """
+    上传一个菜品的全部文件（在线程池中执行）
+    :return: {对象名: CDN URL}，任一文件失败时返回None
+    """
+    urls = {}
+    for key, local_path, optimize in uploads:
+        if not os.path.exists(local_path):
+            print(f"❌ 本地图片不存在: {local_path}")
+            return None
+        
+        sha256 = file_sha256(local_path)
+        # 多分辨率版本按内容哈希命名，与 process_dish_image 上传的一样可以永久缓存
+        cache_control = None if optimize else IMMUTABLE_CACHE_CONTROL
+        cdn_url = manifest.lookup(key, sha256, cache_control)
+        if cdn_url:
+            stats.add(skipped=1)
+        else:
+            if optimize:
+                cdn_url = cdn_service.optimize_and_upload(local_path, key)
+            else:
+                cdn_url = cdn_service.upload_image(local_path, key, cache_control=cache_control)
+            if not cdn_url:
+                return None
+            manifest.record(key, sha256, cdn_url, cache_control)
+            stats.add(uploaded=1, bytes=os.path.getsize(local_path))
+        urls[key] = cdn_url
+    return urls
+
+
+class MigrationStats:
+    """迁移进度与吞吐量统计"""
+    
+    def __init__(self, total):
+        self.total = total
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counts = {'done': 0, 'success': 0, 'failed': 0, 'uploaded': 0, 'skipped': 0, 'bytes': 0}
+    
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                self.counts[name] += value
+    
+    def report(self):
+        elapsed = max(time.time() - self.started, 1e-6)
+        c = self.counts
+        return (f"[{c['done']}/{self.total}] 成功 {c['success']} 失败 {c['failed']} | "
+                f"上传 {c['uploaded']} 个文件 跳过 {c['skipped']} 个 | "
+                f"{c['uploaded'] / elapsed:.1f} 文件/秒 {c['bytes'] / 1024 / 1024 / elapsed:.2f} MB/秒")
+
+
+def apply_dish_urls(dish, urls):
+    """把上传结果写回菜品记录"""
+    variants = json.loads(dish.image_variants) if dish.image_variants else []
+    
+    if variants:
+        for variant in variants:
+            if variant.get('path'):
+                variant['cdn_url'] = urls.get(os.path.basename(variant['path']), variant.get('cdn_url'))
+        default = default_variant(variants)
+        dish.image_cdn_url = default['cdn_url']
+    else:
+        dish.image_cdn_url = urls[os.path.basename(dish.image)]
+    
+    # 如果不需要本地备份，删除本地文件；相同内容的图片共用文件，其他菜品仍在使用本地文件时保留
+    if not Config.LOCAL_BACKUP:
+        for path in remove_dish_image_files(dish, local_only=True):
+            print(f"🗑️  已删除本地文件: {path}")
+        for variant in variants:
+            variant['path'] = None
+        dish.image = None
+    
+    if variants:
+        dish.image_variants = json.dumps(variants)
+
+
+def migrate_existing_images(max_workers=8, batch_size=20):
+    """
+    迁移现有图片到CDN
+    :param max_workers: 并发上传数
+    :param batch_size: 每处理多少个菜品提交一次数据库
+    """
     print("🔄 开始迁移现有图片到CDN...")
     
     if not cdn_service.is_enabled():
@@ -31,54 +170,51 @@ def migrate_existing_images():
                 print("ℹ️  没有找到需要迁移的图片")
                 return True
             
-            print(f"📋 找到 {len(dishes)} 个菜品需要迁移")
+            print(f"📋 找到 {len(dishes)} 个菜品需要迁移（并发 {max_workers}，每 {batch_size} 个提交一次）")
             
-            success_count = 0
-            failed_count = 0
+            os.makedirs(app.instance_path, exist_ok=True)
+            manifest = MigrationManifest(os.path.join(app.instance_path, MANIFEST_FILENAME))
+            stats = MigrationStats(len(dishes))
+            pending_commits = 0
             
-            for dish in dishes:
-                print(f"🔄 迁移菜品 {dish.dish_number}: {dish.name_cn}")
+            # 数据库会话不是线程安全的：线程池只负责上传，结果在主线程写回数据库
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(upload_dish_files, plan_dish_uploads(dish), manifest, stats): dish
+                           for dish in dishes}
                 
-                # 构建本地图片路径
-                local_path = os.path.join('static', dish.image)
-                
-                if not os.path.exists(local_path):
-                    print(f"❌ 本地图片不存在: {local_path}")
-                    failed_count += 1
-                    continue
-                
-                # 提取文件名
-                filename = os.path.basename(dish.image)
-                
-                # 上传到CDN
-                cdn_url = cdn_service.optimize_and_upload(local_path, filename)
-                
-                if cdn_url:
-                    # 更新数据库
-                    dish.image_cdn_url = cdn_url
-                    db.session.commit()
+                for future in as_completed(futures):
+                    dish = futures[future]
+                    try:
+                        urls = future.result()
+                    except Exception as e:
+                        print(f"❌ 迁移异常 {dish.dish_number}: {e}")
+                        urls = None
                     
-                    print(f"✅ 迁移成功: {cdn_url}")
-                    success_count += 1
+                    if urls:
+                        apply_dish_urls(dish, urls)
+                        pending_commits += 1
+                        stats.add(done=1, success=1)
+                    else:
+                        print(f"❌ 迁移失败: {dish.dish_number} {dish.image}")
+                        stats.add(done=1, failed=1)
                     
-                    # 如果不需要本地备份，删除本地文件
-                    if not os.environ.get('LOCAL_BACKUP', 'true').lower() == 'true':
-                        os.remove(local_path)
-                        dish.image = None
+                    if pending_commits >= batch_size:
                         db.session.commit()
-                        print(f"🗑️  已删除本地文件: {local_path}")
-                else:
-                    print(f"❌ 迁移失败: {dish.image}")
-                    failed_count += 1
+                        manifest.save()
+                        pending_commits = 0
+                        print(f"📊 {stats.report()}")
+            
+            db.session.commit()
+            manifest.save()
             
             print(f"\n📊 迁移完成:")
-            print(f"   成功: {success_count}")
-            print(f"   失败: {failed_count}")
+            print(f"   {stats.report()}")
             print(f"   总计: {len(dishes)}")
             
             return True
             
         except Exception as e:
+            db.session.rollback()
             print(f"❌ 迁移异常: {e}")
             return False
 
@@ -174,7 +310,7 @@ def main():
     """主函数"""
     if len(sys.argv) < 2:
         print("使用方法:")
-        print("  python migrate_images.py migrate    # 迁移图片到CDN")
+        print("  python migrate_images.py migrate [并发数] [批量提交数]    # 迁移图片到CDN（可中断后重新运行）")
         print("  python migrate_images.py status     # 检查迁移状态")
         print("  python migrate_images.py cleanup    # 清理本地图片")
         return
@@ -182,7 +318,9 @@ def main():
     command = sys.argv[1].lower()
     
     if command == 'migrate':
-        migrate_existing_images()
+        max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+        batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+        migrate_existing_images(max_workers, batch_size)
     elif command == 'status':
         check_migration_status()
     elif command == 'cleanup':
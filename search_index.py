@@ -0,0 +1,154 @@
+# search_index.py
+# 菜品全文搜索：SQLite FTS5 虚拟表 dish_fts（菜名和描述），rowid 与 dish.id 相同
+# 由应用在写入菜品时同步（见 app.py 的 sync_dish_search_index），中文分词在Python中完成，
+# 所以不用触发器：触发器需要调用只在应用连接上注册的函数，其他连接（如sqlite3命令行）写入 dish 表时会失败
+# 序号不放入全文索引：分类重新编号会改写整个分类的序号，按序号搜索直接使用 dish_number 的唯一索引
+import re
+
+# 中文没有空格分词，写入索引前在每个汉字两侧加空格，每个汉字是一个词；
+# 查询时把连续的汉字作为短语（要求相邻），效果与二元分词相同，同时支持单个汉字的查询
+CJK_PATTERN = re.compile(r'([㐀-䶿一-鿿豈-﫿])')
+
+# unicode61 按Unicode字母数字分词并转小写；remove_diacritics 2 去掉重音符号，"caffe" 可以搜到 "caffè"
+# prefix：为2-3个字符的前缀建索引，边输入边搜索时的短前缀查询不需要扫描词表（单个汉字本身就是完整的词）
+SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS dish_fts USING fts5(
+        name_cn, name_it, description_it,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+# 索引的菜品字段，只有这些字段变化时才需要更新索引（修改价格、图片、序号等不会）
+SEARCH_FIELDS = ('name_cn', 'name_it', 'description_it')
+
+# 早期版本用触发器同步索引，创建索引时删除
+LEGACY_TRIGGERS = ('dish_fts_insert', 'dish_fts_update', 'dish_fts_delete')
+
+# 排序权重（对应 name_cn, name_it, description_it），菜名比描述更重要
+RANK_WEIGHTS = (5.0, 5.0, 1.0)
+
+# 看起来像菜品序号的输入（分类字母 + 数字，如 A12）
+DISH_NUMBER_PATTERN = re.compile(r'^[A-Za-z]\d+$')
+
+# 查询最多使用的词数和字符数，避免超长输入生成很大的查询
+MAX_QUERY_TERMS = 8
+MAX_QUERY_LENGTH = 100
+
+
+def segment_text(text):
+    """
+    中文按字分开，其他文字不变
+    :param text: 原文
+    :return: 用空格分隔汉字后的文本
+    """
+    if not text:
+        return text
+    return CJK_PATTERN.sub(r' \1 ', text)
+
+
+def build_match_query(query):
+    """
+    把用户输入转换成FTS5查询：每个词都必须出现，连续汉字作为短语，每个词都按前缀匹配（边输入边搜索）
+    用户输入的引号、星号、AND/OR等不会被当作查询语法
+    :param query: 用户输入
+    :return: FTS5 MATCH 表达式，没有可搜索的内容时返回None
+    """
+    terms = []
+    for term in (query or '')[:MAX_QUERY_LENGTH].split():
+        # 只包含标点符号的词不会产生任何token；单个字母或数字几乎匹配所有菜品，排序开销最大且没有意义
+        if not any(char.isalnum() for char in term) or (len(term) == 1 and not CJK_PATTERN.match(term)):
+            continue
+        phrase = ' '.join(segment_text(term).split()).replace('"', '""')
+        terms.append(f'"{phrase}"*')
+        if len(terms) >= MAX_QUERY_TERMS:
+            break
+    return ' '.join(terms) or None
+
+
+def search_index_exists(connection):
+    return connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'dish_fts'").first() is not None
+
+
+def index_dishes(connection, rows):
+    """
+    写入或替换菜品的索引
+    :param connection: SQLAlchemy连接
+    :param rows: [(id, name_cn, name_it, description_it)]
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    remove_dishes(connection, [row[0] for row in rows])
+    connection.exec_driver_sql(
+        'INSERT INTO dish_fts (rowid, name_cn, name_it, description_it) VALUES (?, ?, ?, ?)',
+        [(dish_id, segment_text(name_cn), name_it, description_it)
+         for dish_id, name_cn, name_it, description_it in rows])
+
+
+def remove_dishes(connection, dish_ids):
+    if dish_ids:
+        connection.exec_driver_sql('DELETE FROM dish_fts WHERE rowid = ?', [(dish_id,) for dish_id in dish_ids])
+
+
+def rebuild_search_index(connection):
+    """
+    按 dish 表重新生成全部索引（不是通过应用写入的修改，如用sqlite3命令行修改菜名后运行）
+    :param connection: SQLAlchemy连接
+    :return: 写入的菜品数
+    """
+    connection.exec_driver_sql('DELETE FROM dish_fts')
+    rows = connection.exec_driver_sql('SELECT id, name_cn, name_it, description_it FROM dish').fetchall()
+    index_dishes(connection, rows)
+    connection.exec_driver_sql("INSERT INTO dish_fts (dish_fts) VALUES ('optimize')")
+    return len(rows)
+
+
+def create_search_index(connection):
+    """
+    创建搜索表；搜索表是新建的时候写入已有菜品
+    :param connection: SQLAlchemy连接
+    :return: 新建时写入的菜品数，已存在时返回None
+    """
+    existed = search_index_exists(connection)
+    if existed:
+        # 字段与当前定义不同（早期版本包含 dish_number）时重新创建
+        columns = tuple(row[1] for row in connection.exec_driver_sql('PRAGMA table_info(dish_fts)'))
+        if columns != SEARCH_FIELDS:
+            connection.exec_driver_sql('DROP TABLE dish_fts')
+            existed = False
+    connection.exec_driver_sql(SCHEMA)
+    for trigger in LEGACY_TRIGGERS:
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {trigger}')
+    if existed:
+        return None
+    return rebuild_search_index(connection)
+
+
+def search_dish_ids(connection, query, limit):
+    """
+    搜索菜品：输入序号时按序号前缀查找（完全相同的排在最前），其他输入使用全文索引
+    :param connection: SQLAlchemy连接
+    :param query: 用户输入
+    :param limit: 最多返回的数量
+    :return: 按相关度排列的菜品ID
+    """
+    number = (query or '').strip()
+    if DISH_NUMBER_PATTERN.match(number):
+        # GLOB 前缀匹配可以使用 dish_number 的唯一索引；大小写各查一次
+        rows = connection.exec_driver_sql(
+            'SELECT id FROM dish WHERE dish_number GLOB ? OR dish_number GLOB ? '
+            'ORDER BY length(dish_number), dish_number LIMIT ?',
+            (number.upper() + '*', number.lower() + '*', limit)).fetchall()
+        if rows:
+            return [row[0] for row in rows]
+
+    match = build_match_query(query)
+    if not match:
+        return []
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    rows = connection.exec_driver_sql(
+        f'SELECT rowid FROM dish_fts WHERE dish_fts MATCH ? ORDER BY bm25(dish_fts, {weights}) LIMIT ?',
+        (match, limit))
+    return [row[0] for row in rows]
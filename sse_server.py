@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+菜单实时更新推送服务（Server-Sent Events）
+顾客手机上打开的菜单页面通过 /api/menu/events 保持一个长连接，后台修改菜单后立即收到修改内容。
+单进程asyncio实现，只用标准库，几百上千个空闲连接只占少量内存，不占用Gunicorn的工作线程。
+本服务每秒向Flask应用请求一次 /api/menu/changes（只有一次主键查询），
+菜单变化时只请求一次增量数据，再推送给所有连接，不会让每个顾客各自请求一次。
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+import urllib.request
+
+# Flask应用地址（与 gunicorn.conf.py 的 GUNICORN_BIND 一致）
+UPSTREAM = os.environ.get('MENU_SSE_UPSTREAM', 'http://127.0.0.1:8000')
+
+# 本服务监听地址，由Nginx把 /api/menu/events 转发过来
+BIND = os.environ.get('MENU_SSE_BIND', '127.0.0.1:8002')
+
+# 检查菜单版本的间隔（秒）
+POLL_INTERVAL = float(os.environ.get('MENU_SSE_POLL_INTERVAL', 1))
+
+# 最大连接数，超过时返回503，页面改用定时同步
+MAX_CLIENTS = int(os.environ.get('MENU_SSE_MAX_CLIENTS', 2000))
+
+# 空闲连接发送注释行的间隔（秒），避免被Nginx或手机网络当作超时连接断开
+KEEPALIVE_INTERVAL = 25
+
+# 增量数据超过这个大小时只推送版本号，由页面自己请求
+MAX_PUSH_SIZE = 64 * 1024
+
+# 每个连接最多积压的事件数，网络太慢跟不上时断开，页面重连后再同步
+CLIENT_QUEUE_SIZE = 16
+
+EVENTS_PATH = '/api/menu/events'
+
+
+def format_event(event, data, event_id=None):
+    """
+    生成一条SSE事件
+    :param event: 事件名称
+    :param data: 可JSON序列化的数据
+    :param event_id: 事件ID（浏览器重连时通过 Last-Event-ID 带回）
+    :return: 字节
+    """
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+def fetch_changes(since):
+    """
+    从Flask应用获取某个版本之后的菜单修改（在线程中执行）
+    :param since: 菜单版本号，-1 表示只获取当前版本号
+    :return: /api/menu/changes 的返回数据
+    """
+    with urllib.request.urlopen(f'{UPSTREAM}/api/menu/changes?since={since}', timeout=5) as response:
+        return json.load(response)
+
+
+class MenuEventHub:
+    """
+    菜单事件广播
+    每个连接对应一个事件队列，检查到新版本后把同一条事件放入所有队列
+    """
+
+    def __init__(self):
+        self.clients = set()
+        self.version = None
+
+    def broadcast(self, message):
+        for queue in list(self.clients):
+            if queue.qsize() >= CLIENT_QUEUE_SIZE:
+                # 连接积压太多，发完已有的事件后断开
+                self.clients.discard(queue)
+                queue.put_nowait(None)
+            else:
+                queue.put_nowait(message)
+
+    def close(self):
+        """服务停止时结束所有连接"""
+        for queue in list(self.clients):
+            queue.put_nowait(None)
+        self.clients.clear()
+
+    async def poll(self):
+        """定时检查菜单版本，变化时推送增量数据"""
+        upstream_ok = True
+        while True:
+            try:
+                since = -1 if self.version is None else self.version
+                changes = await asyncio.to_thread(fetch_changes, since)
+                if not upstream_ok:
+                    print(f"✅ 已重新连接到 {UPSTREAM}")
+                    upstream_ok = True
+                if self.version is None:
+                    self.version = changes['version']
+                    print(f"📡 当前菜单版本: {self.version}")
+                elif changes['version'] != self.version:
+                    self.publish(since, changes)
+            except (OSError, ValueError, KeyError) as e:
+                if upstream_ok:
+                    print(f"⚠️  无法获取菜单修改（{UPSTREAM}）: {e}")
+                    upstream_ok = False
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def publish(self, since, changes):
+        self.version = changes['version']
+        data = {'version': self.version}
+        if not changes.get('reset'):
+            # 版本号为 since 的页面可以直接合并这份修改，其他页面自己请求
+            payload = {'version': self.version, 'since': since, 'changes': changes}
+            if len(json.dumps(payload, ensure_ascii=False)) <= MAX_PUSH_SIZE:
+                data = payload
+        self.broadcast(format_event('menu', data, self.version))
+        print(f"📣 菜单版本 {since} -> {self.version}，推送给 {len(self.clients)} 个连接")
+
+    async def handle(self, reader, writer):
+        """处理一个HTTP连接：只接受 GET /api/menu/events"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=10)
+            request_line = head.split(b'\r\n', 1)[0].decode('latin-1').split()
+            if len(request_line) < 2 or request_line[0] != 'GET' or request_line[1].split('?')[0] != EVENTS_PATH:
+                writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                return
+            if len(self.clients) >= MAX_CLIENTS:
+                writer.write(b'HTTP/1.1 503 Service Unavailable\r\nRetry-After: 60\r\n'
+                             b'Content-Length: 0\r\nConnection: close\r\n\r\n')
+                return
+            await self.stream(writer)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def stream(self, writer):
+        queue = asyncio.Queue()
+        self.clients.add(queue)
+        try:
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: text/event-stream; charset=utf-8\r\n'
+                         b'Cache-Control: no-cache\r\n'
+                         # 让Nginx不要缓冲事件
+                         b'X-Accel-Buffering: no\r\n'
+                         b'Connection: keep-alive\r\n\r\n')
+            # 断线后5秒重连；连接建立时先告诉页面当前版本，断线期间错过的修改由页面自己同步
+            writer.write(b'retry: 5000\n\n')
+            if self.version is not None:
+                writer.write(format_event('menu', {'version': self.version}, self.version))
+            await writer.drain()
+
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    message = b': keepalive\n\n'
+                if message is None:
+                    break
+                writer.write(message)
+                await writer.drain()
+        finally:
+            self.clients.discard(queue)
+
+
+async def serve(bind):
+    hub = MenuEventHub()
+    host, port = bind.rsplit(':', 1)
+    server = await asyncio.start_server(hub.handle, host, int(port))
+    print(f"🚀 菜单推送服务已启动: http://{bind}{EVENTS_PATH}（上游 {UPSTREAM}）")
+    started = time.time()
+    async with server:
+        poller = asyncio.create_task(hub.poll())
+        try:
+            await server.serve_forever()
+        finally:
+            poller.cancel()
+            hub.close()
+            # 让各连接发完已有的事件并关闭
+            await asyncio.sleep(0.1)
+            print(f"👋 菜单推送服务已停止，运行 {time.time() - started:.0f} 秒")
+
+
+def main():
+    global UPSTREAM
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help', 'help'):
+        print("使用方法:")
+        print("  python sse_server.py [监听地址] [Flask应用地址]")
+        print(f"  默认: python sse_server.py {BIND} {UPSTREAM}")
+        return
+
+    bind = sys.argv[1] if len(sys.argv) > 1 else BIND
+    if len(sys.argv) > 2:
+        UPSTREAM = sys.argv[2].rstrip('/')
+
+    try:
+        asyncio.run(serve(bind))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -50,6 +50,12 @@ function setupEventListeners() {
     document.getElementById('category-form').addEventListener('submit', handleCategorySubmit);
     document.getElementById('allergen-form').addEventListener('submit', handleAllergenSubmit);
 
+    // 拖拽排序：菜品只能在同一分类内拖动，松手后整个分类的新顺序一次提交
+    setupSortableList(document.getElementById('dishes-list'), (groupId, ids) =>
+        saveOrder('/api/dishes/order', { category_id: parseInt(groupId), dish_ids: ids }));
+    setupSortableList(document.getElementById('categories-list'), (groupId, ids) =>
+        saveOrder('/api/categories/order', { category_ids: ids }));
+
     // 模态框点击外部关闭
     document.querySelectorAll('.modal').forEach(modal => {
         modal.addEventListener('click', function(e) {
@@ -136,7 +142,7 @@ function renderDishes() {
         }
         
         return `
-        <div class="item-card dish-card">
+        <div class="item-card dish-card" draggable="true" data-id="${dish.id}" data-group="${dish.category_id}">
             <img src="${imageSrc}" 
                  alt="${dish.name_cn}" class="dish-image" 
                  onerror="handleImageError(this);">
@@ -183,7 +189,7 @@ function renderCategories() {
     }
 
     categoriesList.innerHTML = categoriesData.map(category => `
-        <div class="item-card">
+        <div class="item-card" draggable="true" data-id="${category.id}" data-group="categories">
             <div class="item-header">
                 <div class="item-title">${category.prefix_letter} - ${category.name_cn} / ${category.name_it}</div>
                 <button class="delete-btn" onclick="deleteCategory(${category.id})">删除</button>
@@ -295,6 +301,9 @@ async function handleDishSubmit(e) {
             showSuccess('菜品添加成功！');
             closeModal('dish-modal');
             loadData(); // 重新加载数据
+            if (result.image_job_id) {
+                pollImageJob(result.image_job_id);
+            }
         } else {
             showError(result.message || '添加菜品失败');
         }
@@ -402,6 +411,9 @@ async function handleEditDishSubmit(e) {
             showSuccess('菜品更新成功！');
             closeModal('edit-dish-modal');
             loadData(); // 重新加载数据
+            if (result.image_job_id) {
+                pollImageJob(result.image_job_id);
+            }
         } else {
             showError(result.message || '更新菜品失败');
         }
@@ -411,6 +423,27 @@ async function handleEditDishSubmit(e) {
     }
 }
 
+// 轮询后台图片处理任务，完成后刷新菜品列表
+async function pollImageJob(jobId, interval = 1500) {
+    try {
+        const response = await fetch(`/api/image-job/${jobId}`);
+        const result = await response.json();
+        const job = result.job;
+
+        if (job.status === 'done') {
+            showSuccess('图片处理完成！');
+            loadData();
+        } else if (job.status === 'failed') {
+            showError(`图片处理失败：${job.error || '未知错误'}`);
+        } else {
+            setTimeout(() => pollImageJob(jobId, interval), interval);
+        }
+    } catch (error) {
+        console.error('查询图片任务失败:', error);
+        setTimeout(() => pollImageJob(jobId, interval * 2), interval * 2);
+    }
+}
+
 // 处理分类表单提交
 async function handleCategorySubmit(e) {
     e.preventDefault();
@@ -473,6 +506,77 @@ async function handleAllergenSubmit(e) {
     }
 }
 
+// 拖拽排序：列表中带 draggable 的卡片只能在同一组（data-group）内移动
+function setupSortableList(list, onSort) {
+    let dragged = null;
+    let originalOrder = '';
+
+    const groupIds = group => Array.from(list.querySelectorAll(`.item-card[data-group="${group}"]`))
+        .map(card => parseInt(card.dataset.id));
+
+    list.addEventListener('dragstart', e => {
+        dragged = e.target.closest('.item-card[draggable="true"]');
+        if (!dragged) return;
+        originalOrder = groupIds(dragged.dataset.group).join(',');
+        dragged.classList.add('dragging');
+        e.dataTransfer.effectAllowed = 'move';
+        e.dataTransfer.setData('text/plain', dragged.dataset.id);
+    });
+
+    list.addEventListener('dragover', e => {
+        const target = e.target.closest('.item-card[draggable="true"]');
+        if (!dragged || !target || target.dataset.group !== dragged.dataset.group) return;
+        e.preventDefault();
+        if (target === dragged) return;
+        // 鼠标在目标卡片上半部分时放到它前面，否则放到后面
+        const rect = target.getBoundingClientRect();
+        const after = e.clientY > rect.top + rect.height / 2;
+        list.insertBefore(dragged, after ? target.nextSibling : target);
+    });
+
+    list.addEventListener('drop', e => {
+        if (dragged) e.preventDefault();
+    });
+
+    list.addEventListener('dragend', () => {
+        if (!dragged) return;
+        dragged.classList.remove('dragging');
+        const group = dragged.dataset.group;
+        const ids = groupIds(group);
+        dragged = null;
+        // 顺序有变化时才提交
+        if (ids.join(',') !== originalOrder) {
+            onSort(group, ids);
+        }
+    });
+}
+
+// 保存拖拽后的顺序（一次拖拽只发一个请求）
+async function saveOrder(url, payload) {
+    try {
+        const response = await fetch(url, {
+            method: 'PUT',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(payload)
+        });
+
+        const result = await response.json();
+
+        if (result.success) {
+            showSuccess(result.message);
+        } else {
+            showError(result.message || '保存排序失败');
+        }
+    } catch (error) {
+        console.error('保存排序失败:', error);
+        showError('保存排序失败，请重试');
+    }
+    // 重新加载数据（更新菜品序号；失败时恢复原来的顺序）
+    loadData();
+}
+
 // 删除菜品
 async function deleteDish(dishId) {
     if (!confirm('确定要删除这个菜品吗？')) {
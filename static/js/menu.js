@@ -4,13 +4,33 @@ let currentCategory = 'all';
 let dishesData = [];
 let categoriesData = [];
 let allergensData = [];
+// 当前菜单数据对应的版本号，增量同步时只获取之后的修改
+let menuVersion = null;
+let menuSyncing = false;
+let menuSyncPending = false;
+let menuEvents = null;
+// 当前搜索词和搜索结果（按相关度排列的菜品ID），没有搜索时为null
+let searchQuery = '';
+let searchResults = null;
+let searchRequestId = 0;
+let searchTimer = null;
+
+// 页面停留期间检查菜单修改的间隔（毫秒）
+const MENU_SYNC_INTERVAL = 60000;
+
+// 输入停止多久后开始搜索（毫秒）
+const SEARCH_DELAY = 150;
 
 // 生产环境移除测试日志
 
 // 初始化页面
 document.addEventListener('DOMContentLoaded', function() {
     setupEventListeners();
-    loadData();
+    setupSearch();
+    if (!loadEmbeddedData()) {
+        loadData();
+    }
+    setupMenuSync();
     // 确保侧边栏默认展开
     const sidebar = document.getElementById('sidebar');
     if (sidebar) {
@@ -19,25 +39,44 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
-// 加载数据
-async function loadData() {
+// 使用页面内嵌的菜单数据直接渲染（无需请求API）
+function loadEmbeddedData() {
+    const dataElement = document.getElementById('menu-data');
+    if (!dataElement || !dataElement.textContent.trim()) {
+        return false;
+    }
+
+    try {
+        applyMenuData(JSON.parse(dataElement.textContent));
+    } catch (error) {
+        console.error('解析内嵌菜单数据失败:', error);
+        return false;
+    }
+
+    const lang = dataElement.dataset.lang;
+    if (lang && lang !== currentLanguage) {
+        // switchLanguage 会完成全部渲染
+        switchLanguage(lang);
+    } else {
+        renderAllergenInfo();
+        renderCategoryNav();
+        renderDishes();
+    }
+    return true;
+}
+
+// 加载数据（reload 为 true 时跳过Service Worker中缓存的菜单）
+async function loadData(reload = false) {
     
     
     // 显示加载状态
     showLoadingState();
     
     try {
-        const [dishesResponse, categoriesResponse, allergensResponse] = await Promise.all([
-            fetch('/api/dishes'),
-            fetch('/api/categories'),
-            fetch('/api/allergens')
-        ]);
-
-        dishesData = await dishesResponse.json();
-        categoriesData = await categoriesResponse.json();
-        allergensData = await allergensResponse.json();
+        // 一次请求获取分类、过敏源和菜品
+        const response = await fetch('/api/menu', reload ? { cache: 'reload' } : {});
+        applyMenuData(await response.json());
 
-        
         hideLoadingState();
         renderAllergenInfo();
         renderCategoryNav();
@@ -50,6 +89,206 @@ async function loadData() {
     }
 }
 
+// 保存菜单数据，并把菜品中的过敏源ID还原为过敏源对象
+function applyMenuData(menu) {
+    menuVersion = menu.version === undefined ? null : menu.version;
+    categoriesData = menu.categories;
+    allergensData = menu.allergens;
+
+    const allergensById = {};
+    allergensData.forEach(allergen => {
+        allergensById[allergen.id] = allergen;
+    });
+
+    dishesData = menu.dishes.map(dish => {
+        dish.allergens = (dish.allergen_ids || [])
+            .map(id => allergensById[id])
+            .filter(Boolean);
+        return dish;
+    });
+}
+
+// 增量同步：订阅推送（/api/menu/events），页面重新回到前台时同步一次；
+// 推送不可用时（如本地开发、连接数已满）在页面停留期间定时同步
+function setupMenuSync() {
+    setupMenuEvents();
+    // 页面可能是Service Worker从缓存中返回的，立即同步缓存之后的修改
+    if (navigator.serviceWorker && navigator.serviceWorker.controller) {
+        syncMenuChanges();
+    }
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'visible') {
+            syncMenuChanges();
+        }
+    });
+    setInterval(() => {
+        const pushing = menuEvents && menuEvents.readyState === EventSource.OPEN;
+        if (document.visibilityState === 'visible' && !pushing) {
+            syncMenuChanges();
+        }
+    }, MENU_SYNC_INTERVAL);
+}
+
+// 订阅菜单推送：收到的修改正好接在当前版本之后时直接合并，否则请求增量同步
+function setupMenuEvents() {
+    if (!window.EventSource) {
+        return;
+    }
+    menuEvents = new EventSource('/api/menu/events');
+    menuEvents.addEventListener('menu', e => {
+        const event = JSON.parse(e.data);
+        if (menuVersion === null || event.version === menuVersion) {
+            return;
+        }
+        if (event.changes && event.since === menuVersion && !menuSyncing) {
+            applyMenuChanges(event.changes);
+        } else {
+            syncMenuChanges();
+        }
+    });
+}
+
+// 获取菜单修改并更新本地数据
+async function syncMenuChanges() {
+    if (menuVersion === null) {
+        return;
+    }
+    if (menuSyncing) {
+        // 正在同步时又有新修改，本次同步结束后再同步一次
+        menuSyncPending = true;
+        return;
+    }
+    menuSyncing = true;
+
+    try {
+        const response = await fetch(`/api/menu/changes?since=${menuVersion}`);
+        const changes = await response.json();
+
+        if (changes.reset) {
+            // 服务器无法提供增量修改，重新加载完整菜单
+            await loadData(true);
+        } else if (changes.version > menuVersion) {
+            applyMenuChanges(changes);
+        }
+    } catch (error) {
+        // 网络不好时保留当前菜单，下次再同步
+        console.error('同步菜单失败:', error);
+    } finally {
+        menuSyncing = false;
+    }
+
+    if (menuSyncPending) {
+        menuSyncPending = false;
+        syncMenuChanges();
+    }
+}
+
+// 把增量修改合并到本地数据：先删除，再按ID新增或替换，最后按分类和排序号重新排列
+function applyMenuChanges(changes) {
+    const merge = (items, changed, deletedIds) => {
+        const byId = new Map();
+        items.forEach(item => {
+            if (!deletedIds.includes(item.id)) {
+                byId.set(item.id, item);
+            }
+        });
+        changed.forEach(item => byId.set(item.id, item));
+        return Array.from(byId.values());
+    };
+
+    const categories = merge(categoriesData, changes.categories, changes.deleted.categories)
+        .sort((a, b) => a.sort_order - b.sort_order || a.id - b.id);
+    const allergens = merge(allergensData, changes.allergens, changes.deleted.allergens)
+        .sort((a, b) => a.id - b.id);
+
+    const categoryOrder = {};
+    categories.forEach((category, index) => {
+        categoryOrder[category.id] = index;
+    });
+    const dishes = merge(dishesData, changes.dishes, changes.deleted.dishes)
+        .filter(dish => dish.category_id in categoryOrder)
+        .sort((a, b) => categoryOrder[a.category_id] - categoryOrder[b.category_id]
+            || a.sort_order - b.sort_order || a.id - b.id);
+
+    applyMenuData({ version: changes.version, categories, allergens, dishes });
+
+    // 重新渲染，保持当前选中的分类（已删除时回到"全部"）
+    const keepCategory = ['all', 'new'].includes(currentCategory) || currentCategory in categoryOrder;
+    renderAllergenInfo();
+    renderCategoryNav();
+    switchCategory(keepCategory ? currentCategory : 'all');
+    // 正在搜索时按新的菜单重新搜索
+    if (searchQuery) {
+        runSearch(searchQuery);
+    }
+}
+
+// 设置搜索框：输入停止后搜索，清空时回到分类浏览
+function setupSearch() {
+    const input = document.getElementById('dish-search');
+    if (!input) {
+        return;
+    }
+    input.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => runSearch(input.value.trim()), SEARCH_DELAY);
+    });
+}
+
+// 搜索菜品：由服务器按相关度排序，离线或请求失败时在本地菜单数据中查找
+async function runSearch(query) {
+    searchQuery = query;
+    const requestId = ++searchRequestId;
+    // 单个字母或数字太常见，服务器不会搜索，继续显示当前分类
+    if (query.length < 2 && !/[\u3400-\u9fff]/.test(query)) {
+        searchResults = null;
+        renderDishes();
+        return;
+    }
+
+    let ids;
+    try {
+        const response = await fetch(`/api/search?q=${encodeURIComponent(query)}`);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        ids = (await response.json()).ids;
+    } catch (error) {
+        console.warn('搜索请求失败，使用本地搜索:', error);
+        ids = searchLocally(query);
+    }
+
+    // 只显示最后一次输入的结果
+    if (requestId === searchRequestId) {
+        searchResults = ids;
+        renderDishes();
+    }
+}
+
+// 本地搜索：去掉重音符号后不区分大小写，每个词都出现在序号、菜名或描述中
+function searchLocally(query) {
+    const normalize = text => (text || '').normalize('NFD').replace(/[\u0300-\u036f]/g, '').toLowerCase();
+    const terms = normalize(query).split(/\s+/).filter(term => term);
+    return dishesData
+        .filter(dish => {
+            const text = normalize([dish.dish_number, dish.name_cn, dish.name_it, dish.description_it].join(' '));
+            return terms.every(term => text.includes(term));
+        })
+        .map(dish => dish.id);
+}
+
+// 清空搜索框（点击分类时回到分类浏览）
+function clearSearch() {
+    const input = document.getElementById('dish-search');
+    if (input) {
+        input.value = '';
+    }
+    clearTimeout(searchTimer);
+    searchQuery = '';
+    searchResults = null;
+    searchRequestId++;
+}
+
 // 显示加载状态
 function showLoadingState() {
     const dishesGrid = document.getElementById('dishes-grid');
@@ -80,6 +319,7 @@ function setupEventListeners() {
             switchLanguage(e.target.dataset.lang);
         } else if (e.target.classList.contains('category-btn')) {
             
+            clearSearch();
             switchCategory(e.target.dataset.category);
         } else if (e.target.classList.contains('sidebar-toggle')) {
             
@@ -108,6 +348,11 @@ function switchLanguage(lang) {
         orderInstruction.style.display = lang === 'it' ? 'block' : 'none';
     }
 
+    const searchInput = document.getElementById('dish-search');
+    if (searchInput) {
+        searchInput.placeholder = searchInput.dataset[lang];
+    }
+
     console.log('开始重新渲染内容...');
     // 重新渲染所有内容
     renderAllergenInfo();
@@ -250,9 +495,23 @@ function createDishCard(dish) {
     const imageSrc = dish.image && (dish.image.startsWith('http://') || dish.image.startsWith('https://'))
         ? dish.image
         : (dish.image ? `/static/${dish.image}` : null);
+    // 多分辨率图片：浏览器根据屏幕像素密度和显示宽度选择合适的版本
+    const srcsetAttrs = dish.image_srcset
+        ? `data-srcset="${dish.image_srcset}" sizes="${dish.image_sizes}"`
+        : '';
+    const imgTag = `<img data-src="${imageSrc}" ${srcsetAttrs} alt="${dish[`name_${currentLanguage}`]}" class="dish-image lazy-load" src="/static/images/placeholder.jpg">`;
+    // 支持AVIF/WebP的浏览器优先使用更小的现代格式，其余回退到JPEG
+    const pictureHtml = dish.image_sources && dish.image_sources.length > 0
+        ? `<picture>
+             ${dish.image_sources.map(source =>
+                 `<source type="${source.type}" data-srcset="${source.srcset}" sizes="${dish.image_sizes}">`
+             ).join('')}
+             ${imgTag}
+           </picture>`
+        : imgTag;
     const imageHtml = imageSrc 
         ? `<div class="dish-image-wrapper">
-             <img data-src="${imageSrc}" alt="${dish[`name_${currentLanguage}`]}" class="dish-image lazy-load" src="/static/images/placeholder.jpg">
+             ${pictureHtml}
              ${spicinessBadge}
            </div>`
         : `<div class="dish-image-wrapper">
@@ -357,6 +616,22 @@ function getCurrentCategory() {
     return currentCategory;
 }
 
+// 加载懒加载图片（先设置srcset，避免浏览器先下载回退图片）
+function loadLazyImage(img) {
+    const picture = img.parentElement;
+    if (picture && picture.tagName === 'PICTURE') {
+        picture.querySelectorAll('source[data-srcset]').forEach(source => {
+            source.srcset = source.dataset.srcset;
+        });
+    }
+    if (img.dataset.srcset) {
+        img.srcset = img.dataset.srcset;
+    }
+    img.src = img.dataset.src;
+    img.classList.remove('lazy-load');
+    img.classList.add('loaded');
+}
+
 // 懒加载功能
 function initLazyLoading() {
     const lazyImages = document.querySelectorAll('.lazy-load');
@@ -366,9 +641,7 @@ function initLazyLoading() {
             entries.forEach(entry => {
                 if (entry.isIntersecting) {
                     const img = entry.target;
-                    img.src = img.dataset.src;
-                    img.classList.remove('lazy-load');
-                    img.classList.add('loaded');
+                    loadLazyImage(img);
                     imageObserver.unobserve(img);
                 }
             });
@@ -380,11 +653,7 @@ function initLazyLoading() {
         lazyImages.forEach(img => imageObserver.observe(img));
     } else {
         // 降级处理：直接加载所有图片
-        lazyImages.forEach(img => {
-            img.src = img.dataset.src;
-            img.classList.remove('lazy-load');
-            img.classList.add('loaded');
-        });
+        lazyImages.forEach(img => loadLazyImage(img));
     }
 }
 
@@ -394,7 +663,11 @@ function renderDishes() {
     
     // 过滤菜品
     let filteredDishes = dishesData;
-    if (currentCategory === 'new') {
+    if (searchResults !== null) {
+        // 搜索时显示所有分类中的结果，按相关度排列
+        const dishesById = new Map(dishesData.map(dish => [dish.id, dish]));
+        filteredDishes = searchResults.map(id => dishesById.get(id)).filter(dish => dish);
+    } else if (currentCategory === 'new') {
         // 显示所有新菜
         filteredDishes = dishesData.filter(dish => dish.is_new);
     } else if (currentCategory !== 'all') {
@@ -408,7 +681,9 @@ function renderDishes() {
     if (filteredDishes.length === 0) {
         dishesGrid.innerHTML = `
             <div class="no-dishes">
-                <p>${currentLanguage === 'cn' ? '暂无菜品' : 'Nessun piatto disponibile'}</p>
+                <p>${searchResults !== null
+                    ? (currentLanguage === 'cn' ? '没有找到相关菜品' : 'Nessun piatto trovato')
+                    : (currentLanguage === 'cn' ? '暂无菜品' : 'Nessun piatto disponibile')}</p>
             </div>
         `;
         return;
@@ -0,0 +1,135 @@
+# static_assets.py
+import hashlib
+import json
+import os
+import re
+import sys
+
+from flask import current_app, has_app_context
+
+# 需要加指纹的静态文件类型（模板中通过 url_for 引用的CSS/JS）
+FINGERPRINT_EXTENSIONS = ('.css', '.js')
+
+# 带指纹的文件名：<原文件名>.<内容哈希前10位>.<扩展名>
+FINGERPRINT_LENGTH = 10
+FINGERPRINTED_PATTERN = re.compile(r'\.[0-9a-f]{%d}\.(css|js)$' % FINGERPRINT_LENGTH)
+
+# 清单文件：原文件名 -> 带指纹的文件名
+MANIFEST_FILENAME = 'manifest.json'
+
+
+def is_fingerprinted(filename):
+    """判断文件名是否带内容指纹"""
+    return bool(FINGERPRINTED_PATTERN.search(filename))
+
+
+def fingerprint_file(static_folder, filename):
+    """
+    为单个文件生成带内容指纹的副本（已存在的跳过）
+    :param static_folder: 静态文件目录
+    :param filename: 相对于静态目录的文件名，如 css/style.css
+    :return: 带指纹的文件名，如 css/style.3f2a9c1b7d.css
+    """
+    path = os.path.join(static_folder, filename)
+    with open(path, 'rb') as file:
+        data = file.read()
+    digest = hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]
+    root, extension = os.path.splitext(filename)
+    hashed_name = f"{root}.{digest}{extension}"
+
+    target = os.path.join(static_folder, hashed_name)
+    if not os.path.exists(target):
+        # 先写临时文件再替换，避免多个进程同时启动时读到半个文件
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, target)
+    return hashed_name
+
+
+def build_manifest(static_folder):
+    """
+    为静态目录下的CSS/JS生成带指纹的副本，并写入清单
+    旧的带指纹文件会保留，已打开的旧页面仍能加载到对应版本的资源
+    :param static_folder: 静态文件目录
+    :return: {原文件名: 带指纹的文件名}
+    """
+    manifest = {}
+    for root, _, files in os.walk(static_folder):
+        for name in sorted(files):
+            if not name.endswith(FINGERPRINT_EXTENSIONS) or is_fingerprinted(name):
+                continue
+            filename = os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/')
+            manifest[filename] = fingerprint_file(static_folder, filename)
+
+    manifest_path = os.path.join(static_folder, MANIFEST_FILENAME)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+class StaticAssets:
+    """
+    静态资源指纹
+    启动时为CSS/JS生成按内容哈希命名的副本，url_for('static', ...) 自动改写为带指纹的文件名。
+    文件内容变化后文件名随之变化，浏览器和CDN可以永久缓存，部署后无需手动清理缓存。
+    """
+
+    def __init__(self):
+        self.static_folder = None
+        self.manifest = {}
+        self._mtimes = {}
+
+    def init_app(self, app):
+        """生成指纹并注册 url_for 改写"""
+        self.static_folder = app.static_folder
+        try:
+            self.manifest = build_manifest(self.static_folder)
+            self._mtimes = {name: self._mtime(name) for name in self.manifest}
+        except OSError as e:
+            print(f"⚠️  静态资源指纹生成失败，使用原文件名: {e}")
+            self.manifest = {}
+        app.url_defaults(self._rewrite_static_url)
+
+    def _mtime(self, filename):
+        return os.path.getmtime(os.path.join(self.static_folder, filename))
+
+    def resolve(self, filename):
+        """
+        获取带指纹的文件名，不在清单中的文件原样返回
+        :param filename: 原文件名
+        :return: 带指纹的文件名
+        """
+        hashed_name = self.manifest.get(filename)
+        if hashed_name is None:
+            return filename
+        # 调试模式下修改CSS/JS后立即生效，无需重启；
+        # 在生成URL时检查，因为 app.run(debug=True) 在 init_app 之后才开启调试模式
+        if has_app_context() and current_app.debug:
+            try:
+                mtime = self._mtime(filename)
+                if mtime != self._mtimes.get(filename):
+                    hashed_name = fingerprint_file(self.static_folder, filename)
+                    self.manifest[filename] = hashed_name
+                    self._mtimes[filename] = mtime
+            except OSError:
+                return filename
+        return hashed_name
+
+    def _rewrite_static_url(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = self.resolve(values['filename'])
+
+
+# 创建全局静态资源实例
+static_assets = StaticAssets()
+
+
+if __name__ == '__main__':
+    folder = sys.argv[1] if len(sys.argv) > 1 else 'static'
+    result = build_manifest(folder)
+    for name, hashed_name in sorted(result.items()):
+        print(f"  {name} -> {hashed_name}")
+    print(f"✅ 静态资源指纹生成完成，共 {len(result)} 个文件")
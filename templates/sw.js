@@ -0,0 +1,200 @@
+// 菜单离线缓存（Service Worker）
+// 由 /sw.js 按当前的静态资源指纹和过敏源图标生成，资源变化后本文件内容随之变化，浏览器会自动安装新版本
+const CACHE_VERSION = {{ cache_version|tojson }};
+const PRECACHE_URLS = {{ precache_urls|tojson }};
+// 菜品图片所在的CDN域名（按当前菜单中的图片地址生成）
+const IMAGE_ORIGINS = {{ image_origins|tojson }};
+
+// 带指纹的CSS/JS、过敏源图标：安装时预先缓存，版本变化后删除旧缓存
+const STATIC_CACHE = `menu-static-${CACHE_VERSION}`;
+// 菜单页面和 /api/menu：先返回缓存再后台更新（stale-while-revalidate）
+const PAGE_CACHE = 'menu-pages';
+const DATA_CACHE = 'menu-data';
+// 菜品图片：按最近使用时间淘汰，总大小不超过 MAX_IMAGE_CACHE_BYTES
+const IMAGE_CACHE = 'menu-images';
+const MAX_IMAGE_CACHE_BYTES = 30 * 1024 * 1024;
+// 图片最近使用时间的更新间隔，避免每次显示都重写缓存
+const IMAGE_TOUCH_INTERVAL = 60 * 60 * 1000;
+
+const PRECACHE_PATHS = new Set(PRECACHE_URLS.map(url => new URL(url, self.location.origin).pathname));
+
+self.addEventListener('install', event => {
+    event.waitUntil((async () => {
+        const cache = await caches.open(STATIC_CACHE);
+        // 单个文件失败（如某个图标被删除）不影响安装
+        await Promise.all(PRECACHE_URLS.map(url =>
+            cache.add(url).catch(error => console.warn('预缓存失败:', url, error))));
+        // 首页也提前缓存，下次离线打开可以直接显示
+        try {
+            await updateCache(await caches.open(PAGE_CACHE), new Request('/'), null);
+        } catch (error) {
+            console.warn('缓存首页失败:', error);
+        }
+        await self.skipWaiting();
+    })());
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil((async () => {
+        const names = await caches.keys();
+        await Promise.all(names
+            .filter(name => name.startsWith('menu-static-') && name !== STATIC_CACHE)
+            .map(name => caches.delete(name)));
+        await self.clients.claim();
+    })());
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') {
+        return;
+    }
+    const url = new URL(request.url);
+    // CDN上的菜品图片与本站图片一样缓存；其他域名、后台、增量同步和推送接口都不经过缓存
+    if (url.origin !== self.location.origin) {
+        if (request.destination === 'image' && IMAGE_ORIGINS.includes(url.origin)) {
+            event.respondWith(cachedImage(event, new Request(request.url, { mode: 'cors', credentials: 'omit' })));
+        }
+        return;
+    }
+
+    if (request.mode === 'navigate' && url.pathname === '/') {
+        event.respondWith(staleWhileRevalidate(event, PAGE_CACHE, '/'));
+    } else if (url.pathname === '/api/menu') {
+        event.respondWith(staleWhileRevalidate(event, DATA_CACHE, null));
+    } else if (PRECACHE_PATHS.has(url.pathname)) {
+        event.respondWith(cacheFirst(request, STATIC_CACHE));
+    } else if (url.pathname.startsWith('/static/images/')) {
+        event.respondWith(cachedImage(event));
+    }
+});
+
+// 请求最新版本并写入缓存；菜单版本号（X-Menu-Version）与缓存中相同时不重复写入
+async function updateCache(cache, request, cached) {
+    const response = await fetch(request);
+    if (response.ok) {
+        const version = response.headers.get('X-Menu-Version');
+        if (!cached || !version || cached.headers.get('X-Menu-Version') !== version) {
+            await cache.put(request, response.clone());
+        }
+    }
+    return response;
+}
+
+// 有缓存时立即返回缓存，同时在后台更新；页面打开后通过增量同步获取缓存之后的修改
+async function staleWhileRevalidate(event, cacheName, fallbackUrl) {
+    const request = event.request;
+    const cache = await caches.open(cacheName);
+
+    // 页面要求跳过缓存（如增量同步发现版本号无效）时直接请求服务器
+    if (request.cache === 'reload' || request.cache === 'no-store') {
+        return updateCache(cache, request, null);
+    }
+
+    const cached = await cache.match(request, { ignoreVary: true });
+    const network = updateCache(cache, request, cached);
+    if (cached) {
+        event.waitUntil(network.catch(() => {}));
+        return cached;
+    }
+
+    try {
+        return await network;
+    } catch (error) {
+        // 离线且没有这个地址的缓存（如另一种语言），退回到首页的缓存
+        const fallback = fallbackUrl && await cache.match(fallbackUrl, { ignoreVary: true });
+        if (fallback) {
+            return fallback;
+        }
+        throw error;
+    }
+}
+
+async function cacheFirst(request, cacheName) {
+    const cached = await caches.match(request, { cacheName, ignoreVary: true });
+    return cached || fetch(request);
+}
+
+// 菜品图片：命中时更新最近使用时间，新图片写入后按大小淘汰最久未使用的图片
+// CDN图片以CORS方式请求（networkRequest），才能读取内容和大小；<img> 默认的no-cors请求得到的是不透明响应，
+// 无法计算大小，浏览器还会按很大的估计值占用存储配额，所以不缓存
+async function cachedImage(event, networkRequest = event.request) {
+    const request = event.request;
+    const cache = await caches.open(IMAGE_CACHE);
+    const cached = await cache.match(request, { ignoreVary: true });
+    if (cached) {
+        const lastUsed = parseInt(cached.headers.get('X-Last-Used') || '0', 10);
+        if (Date.now() - lastUsed > IMAGE_TOUCH_INTERVAL) {
+            event.waitUntil(putImage(cache, request, cached.clone()));
+        }
+        return cached;
+    }
+
+    let response;
+    try {
+        response = await fetch(networkRequest);
+    } catch (error) {
+        if (networkRequest === request) {
+            throw error;
+        }
+        // CDN没有返回CORS头（或离线）：按页面原来的方式请求，不缓存
+        return fetch(request);
+    }
+    if (response.ok) {
+        event.waitUntil(putImage(cache, request, response.clone()).then(scheduleImageTrim));
+    }
+    return response;
+}
+
+// 写入图片时记录最近使用时间和大小，淘汰时不需要读取图片内容
+async function putImage(cache, request, response) {
+    const body = await response.blob();
+    const headers = new Headers(response.headers);
+    headers.set('X-Last-Used', String(Date.now()));
+    headers.set('X-Cache-Size', String(body.size));
+    await cache.put(request, new Response(body, {
+        status: response.status,
+        statusText: response.statusText,
+        headers
+    }));
+}
+
+let imageTrim = null;
+
+// 同一时间只运行一次淘汰
+function scheduleImageTrim() {
+    if (!imageTrim) {
+        imageTrim = trimImageCache().finally(() => {
+            imageTrim = null;
+        });
+    }
+    return imageTrim;
+}
+
+async function trimImageCache() {
+    const cache = await caches.open(IMAGE_CACHE);
+    const entries = [];
+    let total = 0;
+    for (const request of await cache.keys()) {
+        const response = await cache.match(request, { ignoreVary: true });
+        if (!response) {
+            continue;
+        }
+        const size = parseInt(response.headers.get('X-Cache-Size') || '0', 10);
+        entries.push({
+            request,
+            size,
+            lastUsed: parseInt(response.headers.get('X-Last-Used') || '0', 10)
+        });
+        total += size;
+    }
+
+    entries.sort((a, b) => a.lastUsed - b.lastUsed);
+    for (const entry of entries) {
+        if (total <= MAX_IMAGE_CACHE_BYTES) {
+            break;
+        }
+        await cache.delete(entry.request, { ignoreVary: true });
+        total -= entry.size;
+    }
+}
@@ -0,0 +1,53 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app.py 在导入时读取 DATABASE_URL，必须在导入前指向临时数据库
+TEST_DB_DIR = tempfile.mkdtemp(prefix='menu-test-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TEST_DB_DIR, 'menu.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db, init_db, Allergen, Category, Dish, DishPortion  # noqa: E402
+
+
+@pytest.fixture
+def menu_app():
+    """每个测试使用一个只有默认分类和过敏源的新数据库"""
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        path = os.path.join(TEST_DB_DIR, 'menu.db' + suffix)
+        if os.path.exists(path):
+            os.remove(path)
+    init_db()
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+def add_dishes(count, category_id=1):
+    """
+    在分类中添加菜品，每道菜带两个分量和两个过敏源，按排序号编号
+    :param count: 菜品数量
+    :param category_id: 分类ID
+    :return: 新增的菜品
+    """
+    category = db.session.get(Category, category_id)
+    allergens = Allergen.query.order_by(Allergen.id).limit(2).all()
+    start = category.next_dish_number
+    dishes = []
+    for number in range(start, start + count):
+        dish = Dish(dish_number=f'{category.prefix_letter}{number}', name_cn=f'测试菜{number}',
+                    name_it=f'Piatto {number}', price=10, category_id=category_id, sort_order=number)
+        dish.portions = [DishPortion(portion_name_cn='小份', portion_name_it='Piccola', price=8, sort_order=0),
+                         DishPortion(portion_name_cn='大份', portion_name_it='Grande', price=12, sort_order=1)]
+        dish.allergens = list(allergens)
+        dishes.append(dish)
+    category.next_dish_number = start + count
+    db.session.add_all(dishes)
+    db.session.commit()
+    return dishes
@@ -0,0 +1,114 @@
+# tests/test_image_jobs.py
+# 图片任务：无法识别的图片在上传时拒绝；后台任务遇到重试也不会成功的错误时直接失败，并删除暂存文件
+import io
+import threading
+
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+import app as app_module
+from app import app, db, Dish, ImageJob, image_job_queue, spool_uploaded_image
+from conftest import add_dishes
+
+
+def upload(data, filename):
+    return FileStorage(stream=io.BytesIO(data), filename=filename)
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (20, 10), (200, 30, 30)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_spool_rejects_invalid_image(menu_app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'IMAGE_SPOOL_FOLDER', str(tmp_path))
+    assert spool_uploaded_image(upload(b'not an image', 'dish.jpg')) is None
+    assert list(tmp_path.iterdir()) == []
+
+    filename = spool_uploaded_image(upload(png_bytes(), 'dish.png'))
+    assert filename is not None
+    assert (tmp_path / filename).exists()
+
+
+def test_unreadable_image_fails_without_retry(menu_app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'IMAGE_SPOOL_FOLDER', str(tmp_path))
+    dish = add_dishes(1)[0]
+    # 绕过上传检查，模拟暂存后损坏的文件
+    (tmp_path / 'broken.jpg').write_bytes(b'not an image')
+    job = image_job_queue.enqueue(dish_id=dish.id, filename='broken.jpg')
+    db.session.commit()
+
+    assert image_job_queue._process_next()
+    job = db.session.get(ImageJob, job.id)
+    assert job.status == 'failed'
+    assert job.attempts == 1
+    assert 'cannot identify image file' in job.error
+    assert not (tmp_path / 'broken.jpg').exists()
+
+
+def test_missing_spool_file_fails_without_retry(menu_app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'IMAGE_SPOOL_FOLDER', str(tmp_path))
+    dish = add_dishes(1)[0]
+    job = image_job_queue.enqueue(dish_id=dish.id, filename='missing.jpg')
+    db.session.commit()
+
+    assert image_job_queue._process_next()
+    job = db.session.get(ImageJob, job.id)
+    assert job.status == 'failed'
+    assert job.attempts == 1
+
+
+def admin_client():
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+    return client
+
+
+def test_failed_dish_number_leaves_no_spooled_image(menu_app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'IMAGE_SPOOL_FOLDER', str(tmp_path))
+    dish = add_dishes(1)[0]
+    client = admin_client()
+    form = {'category_id': '999', 'name_cn': '新菜', 'name_it': 'Nuovo', 'price': '10'}
+
+    response = client.post('/api/dish', data=dict(form, image=(io.BytesIO(png_bytes()), 'dish.png')))
+    assert not response.get_json()['success']
+    response = client.put(f'/api/dish/{dish.id}', data=dict(form, image=(io.BytesIO(png_bytes()), 'dish.png')))
+    assert not response.get_json()['success']
+    # 测试客户端与测试共用会话，模拟请求结束时回滚
+    db.session.rollback()
+
+    assert list(tmp_path.iterdir()) == []
+    assert ImageJob.query.count() == 0
+
+
+def test_deleted_dish_job_does_not_touch_reused_id(menu_app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'IMAGE_SPOOL_FOLDER', str(tmp_path))
+    dish = add_dishes(1)[0]
+    dish_id = dish.id
+    (tmp_path / 'upload.png').write_bytes(png_bytes())
+    job = image_job_queue.enqueue(dish_id=dish_id, filename='upload.png')
+    db.session.commit()
+
+    def process_while_dish_is_replaced(source_path):
+        # 处理图片期间另一个请求删除了菜品，新菜品拿到了同一个ID
+        def replace_dish():
+            client = admin_client()
+            assert client.delete(f'/api/dish/{dish_id}').get_json()['success']
+            assert client.post('/api/dish', data={
+                'category_id': '1', 'name_cn': '新菜', 'name_it': 'Nuovo', 'price': '10'}).get_json()['success']
+        thread = threading.Thread(target=replace_dish)
+        thread.start()
+        thread.join()
+        return 'images/stale_w350.jpg', None, '[]', 'stale'
+
+    monkeypatch.setattr(app_module, 'process_dish_image', process_while_dish_is_replaced)
+    assert image_job_queue._process_next()
+
+    job = db.session.get(ImageJob, job.id)
+    assert job.status == 'failed'
+    new_dish = db.session.get(Dish, dish_id)
+    assert new_dish.name_cn == '新菜'
+    assert new_dish.image is None and new_dish.image_hash is None
+    assert not (tmp_path / 'upload.png').exists()
@@ -0,0 +1,52 @@
+# tests/test_indexes.py
+# 主要查询的查询计划：应用实际发出的语句必须按索引查找，不能全表扫描或临时排序
+import pytest
+
+from app import db, Allergen, Dish, image_job_queue
+from conftest import add_dishes
+from migrate_db import collect_query_plans, hot_queries, plan_problems
+
+HOT_QUERIES = {name: (run, index_names, full_scans) for name, run, index_names, full_scans in hot_queries()}
+
+
+@pytest.fixture(params=[False, True], ids=['no-stats', 'analyzed'])
+def menu_data(request, menu_app):
+    """两个分类各有一些菜品（带分量和过敏源）和一个待处理的图片任务；迁移后数据库有 ANALYZE 统计信息"""
+    dishes = add_dishes(30) + add_dishes(30, category_id=2)
+    # 每个过敏源只出现在部分菜品中（与真实菜单相同），统计信息才会让规划器使用 allergen_id 索引
+    allergens = Allergen.query.order_by(Allergen.id).all()
+    for position, dish in enumerate(dishes):
+        dish.allergens = [allergens[position % len(allergens)]]
+    image_job_queue.enqueue(dish_id=dishes[0].id, filename='pending.jpg')
+    db.session.commit()
+    if request.param:
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+    return dishes
+
+
+@pytest.mark.parametrize('name', list(HOT_QUERIES))
+def test_hot_query_uses_index(menu_data, name):
+    run, index_names, full_scans = HOT_QUERIES[name]
+    plans = collect_query_plans(run)
+    assert plans
+    assert plan_problems(plans, index_names, full_scans) == [], plans
+
+
+def test_plan_problems_rejects_scan_and_temp_sort():
+    # 菜品按分类排序号排序时曾经出现的计划：虽然用到了索引，但整表扫描菜品后又做了一次排序
+    plans = [('SELECT ...', ['SCAN dish USING INDEX ix_dish_category_sort',
+                             'SEARCH category USING INTEGER PRIMARY KEY (rowid=?)',
+                             'USE TEMP B-TREE FOR ORDER BY'])]
+    problems = plan_problems(plans, ('ix_dish_category_sort',), ('category',))
+    assert any(problem.startswith('临时排序') for problem in problems)
+    assert any(problem.startswith('全表扫描') for problem in problems)
+    assert any('ix_dish_category_sort' in problem for problem in problems)
+
+
+def test_renumber_check_leaves_data_unchanged(menu_data):
+    run, _, _ = HOT_QUERIES['分类重新编号']
+    before = db.session.execute(db.select(Dish.id, Dish.dish_number).order_by(Dish.id)).all()
+    collect_query_plans(run)
+    assert db.session.execute(db.select(Dish.id, Dish.dish_number).order_by(Dish.id)).all() == before
+    assert Allergen.query.count() > 0
@@ -0,0 +1,30 @@
+# tests/test_menu_cache.py
+# 多进程菜单缓存：后台保存后立即重新读取，任何进程的快照都不能返回修改前的数据
+import json
+
+from app import app, build_menu_payloads, read_menu_version
+from conftest import add_dishes
+from menu_cache import MenuCache
+
+
+def dish_names(snapshot):
+    return {dish['id']: dish['name_cn'] for dish in json.loads(snapshot.payloads['dishes'])}
+
+
+def test_edit_is_visible_in_other_worker_immediately(menu_app):
+    dish = add_dishes(1)[0]
+    # 另一个工作进程的缓存：它不会收到本进程的 invalidate()
+    other_worker = MenuCache(build_menu_payloads, read_menu_version)
+    assert dish_names(other_worker.get())[dish.id] == dish.name_cn
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+    response = client.put(f'/api/dish/{dish.id}', data={
+        'category_id': dish.category_id, 'name_cn': '新菜名', 'name_it': 'Nuovo', 'price': '12'})
+    assert response.get_json()['success']
+
+    # 后台保存后 admin.js 立即重新请求 /api/dishes
+    assert dish_names(other_worker.get())[dish.id] == '新菜名'
+    dishes = client.get('/api/dishes').get_json()
+    assert {d['id']: d['name_cn'] for d in dishes}[dish.id] == '新菜名'
@@ -0,0 +1,37 @@
+# tests/test_menu_queries.py
+# 菜单快照的查询次数不随菜品数量增加（菜品的分量和过敏源一次性预加载，不按菜品逐个懒加载）
+from flask import g
+
+from app import app, build_menu_payloads
+from conftest import add_dishes
+
+
+def count_queries(func):
+    """通过性能指标的SQL事件统计函数执行的查询次数"""
+    with app.test_request_context():
+        # 测试夹具已推入应用上下文，请求上下文沿用同一个 g，先清零
+        g.metrics_query_count = 0
+        func()
+        return g.metrics_query_count
+
+
+def test_build_menu_payloads_query_count_is_constant(menu_app):
+    add_dishes(3)
+    few = count_queries(build_menu_payloads)
+
+    add_dishes(60)
+    add_dishes(60, category_id=2)
+    many = count_queries(build_menu_payloads)
+
+    assert many == few
+    # 版本号 + 菜品 + 分量 + 过敏源关联 + 分类 + 过敏源
+    assert many == 6
+
+
+def test_menu_payload_contains_preloaded_relations(menu_app):
+    add_dishes(2)
+    payloads = build_menu_payloads()
+    dish = payloads['dishes'][0]
+    assert [portion['name_it'] for portion in dish['portions']] == ['Piccola', 'Grande']
+    assert len(dish['allergens']) == 2
+    assert len(payloads['menu']['dishes'][0]['allergen_ids']) == 2
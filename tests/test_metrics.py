@@ -0,0 +1,32 @@
+# tests/test_metrics.py
+# 多进程指标：工作进程退出后它的文件被合并删除，汇总的计数器不变
+import json
+import os
+
+from metrics import RETIRED_FILENAME, RequestMetrics
+
+
+def write_worker_file(storage_dir, pid, requests):
+    data = {'histograms': [['menu_image_processing_seconds', [], [1, 0, 0, 0, 0, 0, 0, 0, 0, 0.05, 1]]],
+            'counters': [['menu_http_requests_total', [['endpoint', 'index']], requests]]}
+    with open(os.path.join(storage_dir, f'{pid}.json'), 'w') as file:
+        json.dump(data, file)
+
+
+def test_retired_workers_are_merged_and_removed(tmp_path):
+    metrics = RequestMetrics()
+    metrics.storage_dir = str(tmp_path)
+    metrics.increment('menu_http_requests_total', endpoint='index')
+    # max_requests 重启了两次工作进程
+    write_worker_file(tmp_path, 999991, 10)
+    write_worker_file(tmp_path, 999992, 5)
+    before = metrics.render()
+    assert 'menu_http_requests_total{endpoint="index"} 16' in before
+
+    metrics.retire_process(999991)
+    metrics.retire_process(999992)
+
+    assert sorted(os.listdir(tmp_path)) == sorted([f'{os.getpid()}.json', RETIRED_FILENAME])
+    after = metrics.render()
+    assert after == before
+    assert 'menu_image_processing_seconds_count 2' in after
@@ -0,0 +1,97 @@
+# tests/test_renumber.py
+# 分类重新编号：序号有唯一约束，500道菜整体调换顺序时不能冲突，并且要足够快（后台拖拽排序时同步执行）
+import os
+import re
+import time
+
+from sqlalchemy import event
+
+import search_index
+from app import app, db, Category, Dish, commit_menu_changes, reorder_dishes_in_category
+from conftest import add_dishes
+
+DISH_COUNT = 500
+
+# 重新编号500道菜允许的最长时间（秒），取3次中最快的一次；较慢的机器可以用环境变量放宽
+MAX_SECONDS = float(os.environ.get('MENU_RENUMBER_MAX_SECONDS', 0.025))
+
+
+def reverse_sort_order(category_id):
+    dishes = Dish.query.filter_by(category_id=category_id).all()
+    for dish in dishes:
+        dish.sort_order = DISH_COUNT + 1 - dish.sort_order
+    commit_menu_changes()
+
+
+def test_renumber_500_dishes(menu_app, monkeypatch):
+    # 重新编号不改菜名，不应重新分词（搜索索引只更新序号列）
+    segmented = []
+    monkeypatch.setattr(search_index, 'segment_text', lambda text: segmented.append(text) or text)
+    dishes = add_dishes(DISH_COUNT)
+    segmented.clear()
+    dish_ids = [dish.id for dish in dishes]
+
+    timings = []
+    for _ in range(3):
+        # 倒序后每个新序号都与另一道菜的旧序号相同
+        reverse_sort_order(1)
+        started = time.perf_counter()
+        reorder_dishes_in_category(1)
+        commit_menu_changes()
+        timings.append(time.perf_counter() - started)
+
+    numbers = dict(db.session.execute(db.select(Dish.id, Dish.dish_number).where(Dish.category_id == 1)).all())
+    # 倒序了3次：原来排在最后的菜现在是 A1
+    assert numbers[dish_ids[-1]] == 'A1'
+    assert numbers[dish_ids[0]] == f'A{DISH_COUNT}'
+    assert sorted(numbers.values()) == sorted(f'A{n}' for n in range(1, DISH_COUNT + 1))
+    assert db.session.get(Category, 1).next_dish_number == DISH_COUNT + 1
+    assert segmented == []
+    assert min(timings) < MAX_SECONDS, f'重新编号耗时 {min(timings) * 1000:.1f}ms'
+
+
+def test_renumber_updates_search_index(menu_app):
+    dishes = add_dishes(3)
+    reverse_sort_order(1)
+    reorder_dishes_in_category(1)
+    commit_menu_changes()
+
+    client = app.test_client()
+    assert client.get('/api/search?q=A1').get_json()['ids'] == [dishes[-1].id]
+    assert client.get('/api/search?q=A3').get_json()['ids'] == [dishes[0].id]
+
+
+def top_level_sql(statement):
+    """去掉括号内的子查询，只保留语句本身"""
+    depth = 0
+    kept = []
+    for char in statement:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif depth == 0:
+            kept.append(char)
+    return ''.join(kept)
+
+
+def test_renumber_runs_on_sqlite_before_3_33(menu_app):
+    # 部署目标 Ubuntu 20.04 自带 SQLite 3.31：不支持 UPDATE ... FROM（3.33）和 RETURNING（3.35）
+    add_dishes(5)
+    reverse_sort_order(1)
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        reorder_dishes_in_category(1)
+        commit_menu_changes()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    updates = [top_level_sql(s) for s in statements if s.lstrip().upper().startswith('UPDATE DISH')]
+    assert updates
+    for statement in updates:
+        assert not re.search(r'\b(FROM|RETURNING)\b', statement, re.IGNORECASE), statement
+    numbers = [number for (number,) in db.session.execute(
+        db.select(Dish.dish_number).where(Dish.category_id == 1).order_by(Dish.sort_order))]
+    assert numbers == [f'A{n}' for n in range(1, 6)]
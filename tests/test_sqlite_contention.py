@@ -0,0 +1,30 @@
+# tests/test_sqlite_contention.py
+# WAL模式下写事务不阻塞读取：后台保存菜品时，其他工作进程仍能立即重建菜单快照（见 benchmark.py contention）
+import time
+
+from app import db, query_menu_dishes
+from conftest import add_dishes
+from database import sqlite_settings
+
+
+def test_menu_read_is_not_blocked_by_open_write(menu_app):
+    dishes = add_dishes(20)
+    assert sqlite_settings(db.session.connection())['journal_mode'] == 'wal'
+    db.session.commit()
+
+    # 另一个连接持有排他写锁且未提交（非WAL模式下，这会让读取等待 busy_timeout 后报 database is locked）
+    with db.engine.connect() as writer:
+        writer.exec_driver_sql('BEGIN EXCLUSIVE')
+        writer.exec_driver_sql("UPDATE dish SET name_cn = '写入中' WHERE id = ?", (dishes[0].id,))
+
+        started = time.perf_counter()
+        names = [dish.name_cn for dish in query_menu_dishes()]
+        elapsed = time.perf_counter() - started
+        db.session.rollback()
+
+        writer.rollback()
+
+    assert len(names) == 20
+    # 读取的是写事务开始前的数据，并且没有等待写锁
+    assert '写入中' not in names
+    assert elapsed < 1, f'读取等待了 {elapsed:.2f}s'
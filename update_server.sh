@@ -18,6 +18,13 @@ git pull origin main
 echo "清理缓存..."
 python3 clear_cache.py
 
+# 数据库迁移：服务启动时会查询新增的字段，必须先迁移
+echo "执行数据库迁移..."
+if ! python3 migrate_db.py migrate; then
+    echo "数据库迁移失败，服务未启动"
+    exit 1
+fi
+
 # 重启服务
 echo "重启Flask服务..."
 sudo systemctl start menu-app
@@ -27,4 +34,4 @@ echo "检查服务状态..."
 sudo systemctl status menu-app --no-pager
 
 echo "更新完成！"
-echo "请清除浏览器缓存或使用Ctrl+F5强制刷新页面"
+echo "CSS/JS会在服务启动时按内容生成新文件名，无需清除浏览器缓存"
@@ -1,7 +1,7 @@
 #!/bin/bash
 
 # 增强版服务器更新脚本
-# 用于从GitHub拉取更新并重启服务，包含缓存清理
+# 用于从GitHub拉取更新并重启服务，包含缓存清理和静态资源指纹生成
 
 echo "🚀 开始增强版服务器更新..."
 echo "=================================="
@@ -28,13 +28,26 @@ echo "🧹 清理Python缓存..."
 find . -name "*.pyc" -delete
 find . -name "__pycache__" -type d -exec rm -rf {} + 2>/dev/null || true
 
-# 清理浏览器缓存相关文件
-echo "🧹 清理静态文件缓存..."
-# 可以在这里添加清理CDN缓存的命令（如果有的话）
+# 为CSS/JS生成带内容指纹的文件名（内容变化后URL随之变化，浏览器自动获取新版本）
+echo "🔖 生成静态资源指纹..."
+python3 static_assets.py static
+
+# 预压缩CSS/JS静态文件（gzip + brotli）
+echo "🗜️  预压缩静态文件..."
+python3 compression.py static
+
+# 数据库迁移（新增字段、数据表、索引和搜索表）：服务启动时 init_db() 会查询新字段，未迁移的数据库会导致服务无法启动
+echo "🗄️  执行数据库迁移..."
+if ! python3 migrate_db.py migrate; then
+    echo "❌ 数据库迁移失败，服务未启动"
+    exit 1
+fi
 
 # 重启服务
 echo "🔄 重启Flask服务..."
 sudo systemctl start menu
+# 菜单实时推送服务（未安装时跳过）
+sudo systemctl try-restart menu-events
 
 # 等待服务启动
 echo "⏳ 等待服务启动..."
@@ -53,10 +66,8 @@ fi
 echo "=================================="
 echo "🎉 服务器更新完成！"
 echo ""
-echo "💡 重要提示："
-echo "1. 请清除浏览器缓存 (Ctrl+Shift+Delete)"
-echo "2. 强制刷新页面 (Ctrl+F5 或 Cmd+Shift+R)"
-echo "3. 或使用无痕模式打开页面"
-echo "4. 如果仍有问题，请检查服务器日志"
+echo "💡 提示："
+echo "1. CSS/JS已按内容生成新文件名，顾客无需清除浏览器缓存"
+echo "2. 如果仍有问题，请检查服务器日志"
 echo ""
 echo "🔗 访问地址: http://your-server-ip:8081"
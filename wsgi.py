@@ -0,0 +1,19 @@
+# wsgi.py
+# 生产环境入口：gunicorn -c gunicorn.conf.py wsgi:app
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from app import app, db, init_db
+from metrics import request_metrics
+
+# 启动时初始化数据库（表和默认数据已存在时不做修改）
+init_db()
+
+# preload_app 模式下主进程打开的SQLite连接不能被fork出的工作进程共用
+with app.app_context():
+    db.engine.dispose()
+
+# 清空上次运行留下的各进程指标文件
+request_metrics.reset_storage()
+
+# 运行在Nginx之后，信任一层代理传来的客户端IP、协议和域名
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)